@@ -44,6 +44,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Uploaded media, answered before the session/auth middleware can add cookies (see pets/media.py)
+    'pets.middleware.MediaMiddleware',
+    'pets.middleware.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -51,7 +54,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'pets.middleware.AsyncWhiteNoiseMiddleware',
 ]
 
 ROOT_URLCONF = 'AdoptaPaw.urls'
@@ -67,6 +70,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'pets.context_processors.unread_chats',
             ],
         },
     },
@@ -82,9 +86,25 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    },
+    # Holds only the cache table below (see pets/routers.py)
+    'cache': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'cache.sqlite3',
+    },
 }
 
+DATABASE_ROUTERS = ['pets.routers.CacheRouter']
+
+# Shared by the web, worker and scheduler processes, so a cache invalidation in
+# one reaches all of them. Create the table with
+# `manage.py createcachetable --database cache`.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'pets_cache',
+    }
+}
 
 
 # Password validation
@@ -162,3 +182,6 @@ SESSION_EXPIRE_AT_BROWSER_CLOSE = False
 
 # Optional: Save the session to the database on every request (to refresh the expiry time)
 SESSION_SAVE_EVERY_REQUEST = True
+
+# Seconds to cache pet catalog facet counts per filter set (0 disables the cache)
+PET_FACET_CACHE_TIMEOUT = 30
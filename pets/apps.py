@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class PetsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'pets'
+
+    def ready(self):
+        # Connect the signal receivers that keep derived data in sync with the models,
+        # and register the system checks
+        from . import blobs, checks, images, queues, scheduling, search  # noqa: F401
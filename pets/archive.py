@@ -0,0 +1,146 @@
+"""
+Cold storage for old chat messages.
+
+``manage.py archive_messages`` moves each conversation's oldest messages -
+those older than ``CHAT_ARCHIVE_DAYS``, or all of them once the pet is
+adopted - out of the Message table into ``MessageArchive`` segments: up to
+``SEGMENT_SIZE`` messages as zlib-compressed JSON lines.  Archived messages
+are always a prefix of the conversation (message ids grow with time), and
+``Conversation.archived_through_id`` records where that prefix ends.
+
+``chat.history_page`` reads the hot table first and only falls back to
+``archived_page`` when a page runs past the hot rows, so the chatroom pages
+back into the archive without the user noticing.  Archived messages can no
+longer be deleted and no longer count as unread.
+"""
+import json
+import zlib
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from .models import Conversation, Message, MessageArchive
+
+DEFAULT_ARCHIVE_DAYS = 180
+SEGMENT_SIZE = 500
+SEGMENTS_PER_READ = 4
+
+ARCHIVED_FIELDS = ('id', 'sender_id', 'receiver_id', 'pet_id', 'content', 'timestamp')
+
+
+@dataclass
+class ArchivedMessage:
+    """Stands in for a Message in templates; archived messages are read-only."""
+    id: int
+    sender_id: int
+    receiver_id: int
+    pet_id: int
+    content: str
+    timestamp: datetime
+    sender: User = None
+    archived = True
+
+
+def archive_days():
+    return getattr(settings, 'CHAT_ARCHIVE_DAYS', DEFAULT_ARCHIVE_DAYS)
+
+
+def encode(rows):
+    lines = (json.dumps({**row, 'timestamp': row['timestamp'].isoformat()}) for row in rows)
+    return zlib.compress('\n'.join(lines).encode(), 9)
+
+
+def decode(data):
+    messages = []
+    for line in zlib.decompress(bytes(data)).decode().splitlines():
+        row = json.loads(line)
+        row['timestamp'] = datetime.fromisoformat(row['timestamp'])
+        messages.append(ArchivedMessage(**row))
+    return messages
+
+
+def archive_boundaries(older_than, adopted=True):
+    """Map conversation id to the id of its newest message that should be archived, in one query."""
+    condition = Q(timestamp__lt=older_than)
+    if adopted:
+        condition |= Q(conversation__pet__is_adopted=True)
+    rows = (
+        Message.objects.filter(condition, conversation__isnull=False)
+        .values('conversation_id').annotate(boundary=Max('id')).order_by()
+    )
+    return {row['conversation_id']: row['boundary'] for row in rows}
+
+
+def archive_conversation(conversation_id, boundary, segment_size=SEGMENT_SIZE):
+    """Move the conversation's messages up to id ``boundary`` into archive segments.
+
+    Each segment is written, and its rows deleted, in its own short
+    transaction.  Returns the number of messages archived.
+    """
+    archived = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                Message.objects.filter(conversation_id=conversation_id, id__lte=boundary)
+                .order_by('id').values(*ARCHIVED_FIELDS)[:segment_size]
+            )
+            if not rows:
+                return archived
+            first, last = rows[0], rows[-1]
+            MessageArchive.objects.create(
+                conversation_id=conversation_id,
+                first_id=first['id'], last_id=last['id'],
+                first_at=first['timestamp'], last_at=last['timestamp'],
+                message_count=len(rows), data=encode(rows),
+            )
+            Message.objects.filter(conversation_id=conversation_id, id__gte=first['id'], id__lte=last['id']).delete()
+            Conversation.objects.filter(pk=conversation_id, archived_through_id__lt=last['id']).update(
+                archived_through_id=last['id'],
+            )
+        archived += len(rows)
+
+
+def archive_messages(days=None, adopted=True, segment_size=SEGMENT_SIZE):
+    """Archive every conversation's old messages. Returns (conversations, messages) archived."""
+    older_than = timezone.now() - timedelta(days=archive_days() if days is None else days)
+    conversations = messages = 0
+    for conversation_id, boundary in archive_boundaries(older_than, adopted).items():
+        archived = archive_conversation(conversation_id, boundary, segment_size)
+        if archived:
+            conversations += 1
+            messages += archived
+    return conversations, messages
+
+
+def archived_page(key, before=None, size=30):
+    """Up to ``size`` archived messages of the conversation, newest first, with an id below ``before``."""
+    pet_id, buyer_id, seller_id = key
+    segments = MessageArchive.objects.filter(
+        conversation__pet_id=pet_id, conversation__buyer_id=buyer_id, conversation__seller_id=seller_id,
+    ).order_by('-last_id')
+    if before is not None:
+        segments = segments.filter(first_id__lt=before)
+
+    messages = []
+    offset = 0
+    while len(messages) < size:
+        batch = list(segments[offset:offset + SEGMENTS_PER_READ])
+        for segment in batch:
+            messages.extend(
+                message for message in reversed(decode(segment.data))
+                if before is None or message.id < before
+            )
+        if len(batch) < SEGMENTS_PER_READ:
+            break
+        offset += SEGMENTS_PER_READ
+    messages = messages[:size]
+
+    senders = User.objects.in_bulk({message.sender_id for message in messages})
+    for message in messages:
+        message.sender = senders.get(message.sender_id)
+    return messages
@@ -0,0 +1,128 @@
+"""
+Reference counting for content-addressed media (see pets/storage.py).
+
+A ``MediaBlob`` row counts the Pet and Product rows whose image or
+renditions point at a stored file.  The receivers below diff the names a
+row referenced when it was loaded against what it references after a
+save or delete and adjust the counts with one UPDATE each way.  Files
+whose count has dropped to zero are not deleted straight away: an upload
+of the same bytes may be about to reuse them.  ``manage.py dedupe_media
+--collect`` removes blobs that have stayed unreferenced for
+``GC_GRACE``.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.db.models import F
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import MediaBlob, Pet, Product
+from .storage import content_addressed_storage, is_hashed_name
+
+MEDIA_MODELS = (Pet, Product)
+MEDIA_FIELDS = {'image', 'image_renditions'}
+GC_GRACE = timedelta(hours=1)
+
+
+def media_names(image_name, renditions):
+    names = {image_name}
+    names.update(rendition['name'] for rendition in (renditions or {}).values() if isinstance(rendition, dict))
+    return {name for name in names if is_hashed_name(name)}
+
+
+def _ensure_blobs(names):
+    storage = content_addressed_storage
+    MediaBlob.objects.bulk_create(
+        [MediaBlob(name=name, size=storage.size(name) if storage.exists(name) else 0) for name in names],
+        ignore_conflicts=True,
+    )
+
+
+def acquire(names):
+    if not names:
+        return
+    _ensure_blobs(names)
+    MediaBlob.objects.filter(name__in=names).update(refcount=F('refcount') + 1, updated_at=timezone.now())
+
+
+def release(names):
+    if names:
+        MediaBlob.objects.filter(name__in=names, refcount__gt=0).update(
+            refcount=F('refcount') - 1, updated_at=timezone.now(),
+        )
+
+
+def sync_references(instance, created=False):
+    """Move ``instance``'s references from the names it was loaded with to its current ones."""
+    old = set() if created else (getattr(instance, '_media_names', None) or set())
+    new = media_names(instance.image.name, instance.image_renditions)
+    acquire(new - old)
+    release(old - new)
+    instance._media_names = new
+
+
+def rebuild_refcounts():
+    """Recount every blob from the Pet and Product tables. Returns the number of referenced blobs."""
+    counts = Counter()
+    for model in MEDIA_MODELS:
+        for image_name, renditions in model.objects.values_list('image', 'image_renditions').iterator():
+            counts.update(media_names(image_name, renditions))
+
+    MediaBlob.objects.exclude(name__in=list(counts)).update(refcount=0, updated_at=timezone.now())
+    _ensure_blobs(set(counts))
+    for name, count in counts.items():
+        MediaBlob.objects.filter(name=name).update(refcount=count, updated_at=timezone.now())
+    return len(counts)
+
+
+def collect_garbage(grace=GC_GRACE):
+    """Delete blobs unreferenced for longer than ``grace``. Returns (files, bytes) freed."""
+    freed = files = 0
+    cutoff = timezone.now() - grace
+    for blob in MediaBlob.objects.filter(refcount=0, updated_at__lt=cutoff).iterator():
+        # Re-check under the row's own condition so a concurrent acquire wins
+        if MediaBlob.objects.filter(pk=blob.pk, refcount=0).delete()[0]:
+            content_addressed_storage.delete(blob.name)
+            files += 1
+            freed += blob.size
+    return files, freed
+
+
+@receiver(post_init, sender=Pet)
+@receiver(post_init, sender=Product)
+def remember_media_names(sender, instance, **kwargs):
+    # Rows loaded with only() may not have the image columns; pre_save fetches them if needed
+    if MEDIA_FIELDS & instance.get_deferred_fields():
+        instance._media_names = None
+    else:
+        instance._media_names = media_names(instance.image.name, instance.image_renditions)
+
+
+@receiver(pre_save, sender=Pet)
+@receiver(pre_save, sender=Product)
+def load_media_names(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or instance._state.adding or getattr(instance, '_media_names', None) is not None:
+        return
+    if update_fields is not None and not MEDIA_FIELDS & set(update_fields):
+        return
+    stored = sender.objects.filter(pk=instance.pk).values_list('image', 'image_renditions').first()
+    instance._media_names = media_names(*stored) if stored else set()
+
+
+@receiver(post_save, sender=Pet)
+@receiver(post_save, sender=Product)
+def update_media_references(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and not MEDIA_FIELDS & set(update_fields)):
+        return
+    sync_references(instance, created=created)
+
+
+@receiver(post_delete, sender=Pet)
+@receiver(post_delete, sender=Product)
+def release_media_references(sender, instance, **kwargs):
+    names = getattr(instance, '_media_names', None)
+    if names is None:
+        names = media_names(instance.image.name, instance.image_renditions)
+    release(names)
@@ -0,0 +1,60 @@
+"""
+Pub/sub for live chat.
+
+Views publish a serialized message to a conversation's channel after the
+row is committed; WebSocket and long-poll clients subscribed to that
+channel receive it.  ``get_broker()`` returns the broker named by the
+``CHAT_BROKER`` setting, so the in-process ``InMemoryBroker`` (enough for
+a single server process) can be swapped for a shared one, e.g. backed by
+Redis or PostgreSQL LISTEN/NOTIFY, with the same two methods:
+
+* ``publish(channel, message)`` - callable from sync code in any thread;
+* ``subscribe(channel)`` - an async context manager yielding an object
+  with ``await get()``, the next message published to the channel.
+"""
+import asyncio
+import threading
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+DEFAULT_BROKER = 'pets.broker.InMemoryBroker'
+
+
+class InMemoryBroker:
+    """Delivers to subscribers in this process only."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)  # channel -> {(event loop, queue)}
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, message)
+            except RuntimeError:
+                # The subscriber's event loop has shut down
+                pass
+
+    @asynccontextmanager
+    async def subscribe(self, channel):
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue())
+        with self._lock:
+            self._subscribers[channel].add(subscriber)
+        try:
+            yield subscriber[1]
+        finally:
+            with self._lock:
+                self._subscribers[channel].discard(subscriber)
+                if not self._subscribers[channel]:
+                    del self._subscribers[channel]
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    return import_string(getattr(settings, 'CHAT_BROKER', DEFAULT_BROKER))()
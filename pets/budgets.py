@@ -0,0 +1,134 @@
+"""
+Per-view SQL budgets for every route in pets/urls.py.
+
+``QueryBudgetMiddleware`` measures each request against these numbers and
+logs the ones that go over; ``manage.py check_query_budgets`` (and the
+same replay in pets/tests.py, under ``manage.py test``) runs every route
+against a seeded test database and fails when one does.  Counts
+include the four session and auth queries of a logged-in request and the
+queries on every database alias (the cache has its own, see
+pets/routers.py), so a list page that is not N+1 stays at a small constant
+however large the seeded tables are.  When a view legitimately needs more, raise its budget here in the
+same change.
+"""
+import time
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass
+
+from django.db import connections
+
+DEFAULT_MAX_DB_MS = 50.0
+
+
+@dataclass(frozen=True)
+class Budget:
+    max_queries: int
+    max_db_ms: float = DEFAULT_MAX_DB_MS
+
+
+# Keyed by URL name.  The cache is a database (see pets/caching.py): a warm read
+# costs 1 query, a cold rebuild 10 plus the query it caches, and each invalidation
+# or plain cache.set() 4 (Django's DatabaseCache counts the table on every write).
+BUDGETS = {
+    'home': Budget(4),
+    'about': Budget(4),
+    'footer.html': Budget(4),
+    # latest pets on a cold cache (6 when warm)
+    'user_home': Budget(16),
+    # assigned-work page plus the per-doctor counts on a cold cache (9 when warm)
+    'doctor_home': Budget(19),
+    'admin_home': Budget(6),
+    'contact_us': Budget(4),
+    'login': Budget(4),
+    'register': Budget(4),
+    'logout': Budget(4),
+    'pet_detail': Budget(8),
+    # facet counts on a cold cache (7 when warm)
+    'viewpets': Budget(12),
+    'create_or_redirect_chat': Budget(7),
+    'chatroom': Budget(13),
+    'chat_messages': Budget(9),
+    'unread_messages': Budget(6),
+    'delete_message': Budget(11),
+    'seller_chat_list': Budget(7),
+    'seller_home': Budget(6),
+    # including the latest-pets invalidation, as for every route that changes a listed pet
+    'add_pets': Budget(12),
+    'view_my_pets': Budget(7),
+    'feedback': Budget(5),
+    'submit_feedback': Budget(6),
+    'thank_you': Budget(5),
+    'buyer_request': Budget(7),
+    'update_buyer_request_status': Budget(10),
+    # One more than the buyer/clearance decisions for the reviewer role check
+    'update_seller_request_status': Budget(11),
+    # including the doctor's clearance counts invalidation
+    'update_clearance_status': Budget(15),
+    'bulk_update_requests': Budget(15),
+    'seller_requests': Budget(7),
+    'view_seller_request': Budget(6),
+    'request_doctor_clearance': Budget(7),
+    'my_requests': Budget(5),
+    'manage_users': Budget(6),
+    'mark_as_adopted': Budget(13),
+    'activate_user': Budget(9),
+    'deactivate_user': Budget(9),
+    'update_pet_status': Budget(13),
+    'approve_pets': Budget(7),
+    # rejecting 20 pets: batched cascade plus one search-index delete per pet,
+    # one grouped count and one counter UPDATE for all cascaded requests, the admin check,
+    # and invalidating the latest pets and the assigned doctor's counts
+    'bulk_moderate_pets': Budget(47),
+    'approve_pet': Budget(13),
+    'reject_pet': Budget(25),
+    'add_doctor': Budget(5),
+    'view_doctors': Budget(6),
+    'edit_doctor': Budget(6),
+    'delete_doctor': Budget(7),
+    'view_feedback': Budget(5),
+    'forgot_password': Budget(4),
+    'reset_password': Budget(4),
+    'shop': Budget(5),
+}
+
+
+class QueryRecorder:
+    """``connection.execute_wrapper`` hook that counts and times queries; see ``recording``."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+    @property
+    def duration_ms(self):
+        return self.duration * 1000
+
+
+@contextmanager
+def recording(recorder):
+    """Install ``recorder`` on this thread's connection to every database."""
+    with ExitStack() as stack:
+        for conn in connections.all():
+            stack.enter_context(conn.execute_wrapper(recorder))
+        yield recorder
+
+
+def over_budget(url_name, recorder):
+    """Return a description of how ``recorder`` exceeds the view's budget, or None."""
+    budget = BUDGETS.get(url_name)
+    if budget is None:
+        return None
+    problems = []
+    if recorder.count > budget.max_queries:
+        problems.append(f"{recorder.count} queries (budget {budget.max_queries})")
+    if recorder.duration_ms > budget.max_db_ms:
+        problems.append(f"{recorder.duration_ms:.1f}ms in the database (budget {budget.max_db_ms:.0f}ms)")
+    return ', '.join(problems) or None
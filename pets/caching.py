@@ -0,0 +1,104 @@
+"""
+Versioned cache entries with stampede protection.
+
+A namespace owns a version and one entry holding the value together with
+the version it was built for and when.  Invalidating writes a new version,
+which makes the entry stale instead of deleting it, so concurrent readers
+never race a delete.  A read fetches the version and the entry in one
+``get_many``.  When the entry is stale or older than its timeout, only the
+caller that wins ``cache.add`` on the rebuild lock runs the query;
+everyone else keeps serving the stale value until the new one lands.
+
+settings.CACHES points at one cache shared by every process (web, image
+worker, clearance scheduler), so a bump made by any of them is seen by the
+others on their next read.  A bump writes a fresh random version rather
+than incrementing, so two processes invalidating at once cannot both land
+on the same new version.  The cache is a database, so its queries count
+against the view budgets (pets/budgets.py) like any other: one on a warm
+read.
+"""
+import time
+import uuid
+
+from django.core.cache import cache
+from django.db.models import Count
+
+from .models import DoctorClearanceRequest, Pet
+
+LOCK_TIMEOUT = 10
+WAIT_INTERVAL = 0.05
+WAIT_ATTEMPTS = 20
+
+LATEST_PETS = 'pets:latest'
+LATEST_PETS_COUNT = 6
+LATEST_PETS_TIMEOUT = 60 * 60
+
+DOCTOR_CLEARANCES = 'pets:doctor:{}:clearances'
+DOCTOR_CLEARANCES_TIMEOUT = 60 * 60
+
+
+def bump_version(namespace):
+    cache.set(f'{namespace}:version', uuid.uuid4().hex, None)
+
+
+def get_or_rebuild(namespace, build, timeout):
+    version_key, entry_key = f'{namespace}:version', f'{namespace}:entry'
+    found = cache.get_many([version_key, entry_key])
+    # None until the first bump; any bump makes entries built before it stale
+    version = found.get(version_key)
+    # (version, built at, value); kept without expiry so there is always a stale value to serve
+    entry = found.get(entry_key)
+    if entry is not None and entry[0] == version and time.time() - entry[1] < timeout:
+        return entry[2]
+
+    lock = f'{namespace}:{version}:lock'
+    if cache.add(lock, 1, LOCK_TIMEOUT):
+        try:
+            value = build()
+            cache.set(entry_key, (version, time.time(), value), None)
+        finally:
+            cache.delete(lock)
+        return value
+
+    if entry is not None:
+        return entry[2]
+
+    # Cold cache and someone else is rebuilding: wait briefly for their result.
+    for _ in range(WAIT_ATTEMPTS):
+        time.sleep(WAIT_INTERVAL)
+        entry = cache.get(entry_key)
+        if entry is not None and entry[0] == version:
+            return entry[2]
+    return build()
+
+
+def latest_pets():
+    """The newest approved pets shown on the user dashboard."""
+    return get_or_rebuild(
+        LATEST_PETS,
+        lambda: list(Pet.objects.filter(is_approved=True).for_list().order_by('-id')[:LATEST_PETS_COUNT]),
+        LATEST_PETS_TIMEOUT,
+    )
+
+
+def invalidate_latest_pets():
+    """Call whenever a pet is created, approved, rejected or adopted."""
+    bump_version(LATEST_PETS)
+
+
+def doctor_clearance_counts(doctor_id):
+    """{status: count} of the clearance requests assigned to one doctor."""
+    return get_or_rebuild(
+        DOCTOR_CLEARANCES.format(doctor_id),
+        lambda: dict(
+            DoctorClearanceRequest.objects.filter(doctor_id=doctor_id)
+            .values_list('status').annotate(count=Count('id')).order_by()
+        ),
+        DOCTOR_CLEARANCES_TIMEOUT,
+    )
+
+
+def invalidate_doctor_clearances(doctor_id):
+    """Call whenever a request is assigned to or taken from the doctor, or changes status."""
+    if doctor_id is not None:
+        bump_version(DOCTOR_CLEARANCES.format(doctor_id))
@@ -0,0 +1,154 @@
+"""
+Keyset (cursor) pagination and filtering for the pet catalog.
+
+Pages are cut on the primary key instead of OFFSET, so every page is a
+single index range scan of ``PAGE_SIZE + 1`` rows however deep the
+visitor has scrolled.  The filters mirror the composite indexes declared
+on ``Pet.Meta.indexes``.
+"""
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlencode
+
+from django.db.models import Q
+
+PAGE_SIZE = 24
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+TEXT_FILTERS = ('pet_type', 'breed', 'gender')
+
+
+@dataclass
+class Page:
+    items: list = field(default_factory=list)
+    next_cursor: int = None
+    prev_cursor: int = None
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def _parse_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_cursor(value):
+    cursor = _parse_int(value)
+    return cursor if cursor and cursor > 0 else None
+
+
+def parse_filters(params):
+    """Return the catalog filters found in a QueryDict, dropping blank or invalid values."""
+    filters = {}
+    for name in TEXT_FILTERS:
+        value = (params.get(name) or '').strip()
+        if value:
+            filters[name] = value
+
+    for name in ('age_min', 'age_max'):
+        value = _parse_int(params.get(name))
+        if value is not None and value >= 0:
+            filters[name] = value
+
+    adopted = params.get('is_adopted')
+    if adopted in ('0', '1'):
+        filters['is_adopted'] = adopted == '1'
+    return filters
+
+
+def apply_filters(queryset, filters):
+    lookups = {name: filters[name] for name in TEXT_FILTERS if name in filters}
+    if 'age_min' in filters:
+        lookups['age__gte'] = filters['age_min']
+    if 'age_max' in filters:
+        lookups['age__lte'] = filters['age_max']
+    if 'is_adopted' in filters:
+        lookups['is_adopted'] = filters['is_adopted']
+    return queryset.filter(**lookups)
+
+
+def filters_querystring(filters, **extra):
+    """Encode filters (plus e.g. a cursor) back into a query string for page links."""
+    params = {}
+    for name, value in filters.items():
+        params[name] = ('1' if value else '0') if isinstance(value, bool) else value
+    params.update({name: value for name, value in extra.items() if value is not None})
+    return urlencode(params)
+
+
+def keyset_page(queryset, after=None, before=None, size=PAGE_SIZE, descending=True):
+    """
+    Return one page of ``queryset`` ordered by ``id``.
+
+    ``after`` continues past the last row of the previous page, ``before``
+    walks back towards the first page.  Newest rows come first unless
+    ``descending`` is False.
+    """
+    forward_lookup, backward_lookup = ('id__lt', 'id__gt') if descending else ('id__gt', 'id__lt')
+    forward_order, backward_order = ('-id', 'id') if descending else ('id', '-id')
+
+    if before is not None:
+        rows = list(queryset.filter(**{backward_lookup: before}).order_by(backward_order)[:size + 1])
+        has_more = len(rows) > size
+        rows = rows[:size][::-1]
+        return Page(
+            items=rows,
+            next_cursor=rows[-1].id if rows else None,
+            prev_cursor=rows[0].id if rows and has_more else None,
+        )
+
+    if after is not None:
+        queryset = queryset.filter(**{forward_lookup: after})
+    rows = list(queryset.order_by(forward_order)[:size + 1])
+    has_more = len(rows) > size
+    rows = rows[:size]
+    return Page(
+        items=rows,
+        next_cursor=rows[-1].id if rows and has_more else None,
+        prev_cursor=rows[0].id if rows and after is not None else None,
+    )
+
+
+def timestamp_cursor(timestamp, row_id):
+    """Encode a (timestamp, id) position as "<microseconds since the epoch>.<id>"."""
+    delta = timestamp - _EPOCH
+    microseconds = (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+    return f'{microseconds}.{row_id}'
+
+
+def parse_timestamp_cursor(value):
+    try:
+        microseconds, row_id = (int(part) for part in (value or '').split('.'))
+        return _EPOCH + timedelta(microseconds=microseconds), row_id
+    except (ValueError, OverflowError):
+        return None
+
+
+def timestamp_keyset_page(queryset, field_name, after=None, size=PAGE_SIZE):
+    """
+    One page of ``queryset`` ordered by ``-field_name, -id``, for lists kept
+    in time order by a composite (..., -field_name, -id) index.
+
+    ``after`` is a parsed ``timestamp_cursor``; rows with a null timestamp
+    are never returned.
+    """
+    queryset = queryset.filter(**{f'{field_name}__isnull': False})
+    if after is not None:
+        timestamp, row_id = after
+        queryset = queryset.filter(
+            Q(**{f'{field_name}__lt': timestamp}) | Q(**{field_name: timestamp, 'id__lt': row_id})
+        )
+    rows = list(queryset.order_by(f'-{field_name}', '-id')[:size + 1])
+    has_more = len(rows) > size
+    rows = rows[:size]
+    last = rows[-1] if rows else None
+    return Page(rows, next_cursor=timestamp_cursor(getattr(last, field_name), last.id) if has_more else None)
@@ -0,0 +1,212 @@
+"""
+Chat between a pet's owner (the seller) and one prospective buyer.
+
+Each (pet, buyer, seller) thread is a ``Conversation`` row carrying the
+inbox summary - last message time and preview, message count.  Every way
+of sending a message - the chatroom form, its WebSocket - goes through
+``send_message``, which stores the row and updates that summary in one
+transaction, then publishes the message to the conversation's broker
+channel once it commits.  Clients that cannot hold a WebSocket long-poll
+``messages_since`` instead.
+
+Each participant has a read cursor on the conversation, the id of the
+last message they have seen.  Sending a message moves the sender's
+cursor; showing messages to the other side moves theirs with
+``mark_read``.  ``unread_counts`` turns the cursors into per-conversation
+counts with one grouped query over the (conversation, -id) index, reading
+only the unread rows.
+
+History pages and inboxes are keyset-paginated range scans of the
+(conversation, -id) and (seller|buyer, -last_message_at, -id) indexes, so
+they cost the same however many messages exist.  Old messages move to
+compressed archive segments (pets/archive.py), which history pages read
+once they get past the messages still in the hot table.
+"""
+from django.contrib.auth.models import User
+from django.core.exceptions import PermissionDenied
+from django.db import transaction
+from django.db.models import Case, Count, F, PositiveBigIntegerField, Q, Value, When
+
+from .archive import archived_page
+from .broker import get_broker
+from .catalog import Page, keyset_page, timestamp_keyset_page
+from .models import Conversation, Message, Pet
+
+MAX_NEW_MESSAGES = 100
+HISTORY_PAGE_SIZE = 30
+INBOX_PAGE_SIZE = 25
+PREVIEW_LENGTH = 100
+
+
+def participants(pet, user, other):
+    """Return (buyer_id, seller_id) if ``user`` may chat with ``other`` about ``pet``, else None."""
+    if user.id == other.id or pet.owner_id not in (user.id, other.id):
+        return None
+    buyer = other if user.id == pet.owner_id else user
+    return buyer.id, pet.owner_id
+
+
+def role_of(key, user):
+    """'buyer' or 'seller': which side of the conversation ``user`` is on."""
+    return 'seller' if user.id == key[2] else 'buyer'
+
+
+def channel_name(key):
+    return 'chat.{}.{}.{}'.format(*key)
+
+
+def open_conversation(user, pet_id, other_user_id):
+    """Return (pet, other, key) if ``user`` may chat with that user about that pet, else None.
+
+    ``key`` is the conversation's (pet_id, buyer_id, seller_id); the row itself
+    only exists once a message has been sent.
+    """
+    pet = Pet.objects.filter(id=pet_id).only('id', 'owner_id').first()
+    other = User.objects.filter(id=other_user_id).first()
+    if pet is None or other is None:
+        return None
+    conversation = participants(pet, user, other)
+    if conversation is None:
+        return None
+    return pet, other, (pet.id, *conversation)
+
+
+def _messages(key):
+    pet_id, buyer_id, seller_id = key
+    return Message.objects.filter(
+        conversation__pet_id=pet_id, conversation__buyer_id=buyer_id, conversation__seller_id=seller_id,
+    ).select_related('sender', 'conversation')
+
+
+def messages_since(key, since, limit=MAX_NEW_MESSAGES):
+    """The conversation's messages with an id above ``since``, oldest first."""
+    return list(_messages(key).filter(id__gt=since).order_by('id')[:limit])
+
+
+def history_page(key, before=None, size=HISTORY_PAGE_SIZE):
+    """A page of the conversation, newest first, older than message id ``before`` if given.
+
+    ``next_cursor`` continues to older messages.  Once the hot table runs
+    out the page continues from the conversation's archive (pets/archive.py).
+    """
+    page = keyset_page(_messages(key), after=before, size=size)
+    if page.has_next:
+        return page
+    # Only conversations known to have an archive pay for the lookup, unless
+    # the page started below every hot row
+    if page.items and not page.items[-1].conversation.archived_through_id:
+        return page
+    older = archived_page(key, before=page.items[-1].id if page.items else before, size=size - len(page.items) + 1)
+    items = page.items + older[:size - len(page.items)]
+    return Page(items, next_cursor=items[-1].id if len(older) > size - len(page.items) else None)
+
+
+def preview(content):
+    content = ' '.join(content.split())
+    return content if len(content) <= PREVIEW_LENGTH else content[:PREVIEW_LENGTH - 1] + '…'
+
+
+def serialize_message(message):
+    sender = message.sender
+    return {
+        'id': message.id,
+        'sender_id': message.sender_id,
+        'sender_name': sender.get_full_name() or sender.username,
+        'content': message.content,
+        'timestamp': message.timestamp.isoformat(),
+    }
+
+
+def send_message(pet, sender, receiver, content):
+    buyer_seller = participants(pet, sender, receiver)
+    if buyer_seller is None:
+        raise PermissionDenied("Only the pet's owner and a buyer can chat about it.")
+    buyer_id, seller_id = buyer_seller
+
+    with transaction.atomic():
+        conversation, _ = Conversation.objects.get_or_create(pet_id=pet.id, buyer_id=buyer_id, seller_id=seller_id)
+        message = Message.objects.create(
+            pet=pet, sender=sender, receiver=receiver, content=content, conversation=conversation,
+        )
+        # One UPDATE; a concurrent older message never overwrites a newer summary
+        newer = Q(last_message_at__isnull=True) | Q(last_message_at__lte=message.timestamp)
+        read_cursor = f'{role_of((pet.id, buyer_id, seller_id), sender)}_last_read_id'
+        read_up_to = Case(
+            When(**{f'{read_cursor}__lt': message.id}, then=Value(message.id)),
+            default=F(read_cursor), output_field=PositiveBigIntegerField(),
+        )
+        Conversation.objects.filter(pk=conversation.pk).update(
+            message_count=F('message_count') + 1,
+            # The sender has read everything up to their own message
+            **{read_cursor: read_up_to},
+            last_message_at=Case(When(newer, then=Value(message.timestamp)), default=F('last_message_at')),
+            last_message=Case(When(newer, then=Value(preview(content))), default=F('last_message')),
+        )
+        payload = serialize_message(message)
+        channel = channel_name((pet.id, buyer_id, seller_id))
+        transaction.on_commit(lambda: get_broker().publish(channel, payload))
+    return message
+
+
+def delete_message(message):
+    with transaction.atomic():
+        message.delete()
+        if message.conversation_id is None:
+            return
+        latest = (
+            Message.objects.filter(conversation_id=message.conversation_id)
+            .order_by('-id').values('timestamp', 'content').first()
+        )
+        Conversation.objects.filter(pk=message.conversation_id, message_count__gt=0).update(
+            message_count=F('message_count') - 1,
+            last_message_at=latest['timestamp'] if latest else None,
+            last_message=preview(latest['content']) if latest else '',
+        )
+
+
+def mark_read(key, user, message_id):
+    """Move ``user``'s read cursor forward to ``message_id``; never moves it back."""
+    if not message_id:
+        return
+    read_cursor = f'{role_of(key, user)}_last_read_id'
+    pet_id, buyer_id, seller_id = key
+    Conversation.objects.filter(
+        pet_id=pet_id, buyer_id=buyer_id, seller_id=seller_id, **{f'{read_cursor}__lt': message_id},
+    ).update(**{read_cursor: message_id})
+
+
+def unread_counts(user, role=None):
+    """Map conversation id to the number of messages ``user`` has not read, in one query.
+
+    Conversations with nothing unread are left out.  ``role`` limits the
+    result to the conversations where ``user`` is the 'buyer' or 'seller'.
+    """
+    sides = {
+        side: Q(**{f'conversation__{side}': user, 'id__gt': F(f'conversation__{side}_last_read_id')})
+        for side in ('buyer', 'seller') if role in (None, side)
+    }
+    condition = Q()
+    for side_condition in sides.values():
+        condition |= side_condition
+    rows = (
+        Message.objects.filter(condition).exclude(sender=user)
+        .values('conversation_id').annotate(unread=Count('id')).order_by()
+    )
+    return {row['conversation_id']: row['unread'] for row in rows}
+
+
+def inbox_page(user, role='seller', after=None, size=INBOX_PAGE_SIZE):
+    """``user``'s conversations as seller (or buyer), most recently active first.
+
+    ``after`` is a parsed ``catalog.timestamp_cursor``.
+    """
+    other = 'buyer' if role == 'seller' else 'seller'
+    conversations = (
+        Conversation.objects.filter(**{role: user})
+        .select_related('pet', other)
+        .only(
+            'id', 'last_message_at', 'last_message', 'message_count', role,
+            'pet__id', 'pet__name', f'{other}__id', f'{other}__username',
+        )
+    )
+    return timestamp_keyset_page(conversations, 'last_message_at', after=after, size=size)
@@ -0,0 +1,31 @@
+"""
+System checks for deployment settings the pets app relies on.
+
+Cache invalidations (``caching.bump_version``) are made by whichever
+process changes the data: the web process, the image worker or the
+clearance scheduler.  With a process-local cache backend the others never
+see them, so e.g. a doctor's dashboard keeps its counts until the entry
+expires.  ``manage.py check`` warns about such a configuration.
+"""
+from django.conf import settings
+from django.core.checks import Warning, register
+
+PROCESS_LOCAL_CACHES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [
+        Warning(
+            f"The default cache ({backend}) is not shared between processes.",
+            hint="Invalidations made by the image worker and the clearance scheduler will not "
+                 "reach the web process. Point CACHES['default'] at a shared backend.",
+            id='pets.W001',
+        )
+    ]
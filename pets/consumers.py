@@ -0,0 +1,132 @@
+"""
+WebSocket endpoint for the chatroom, as a plain ASGI application.
+
+``AdoptaPaw/asgi.py`` hands every ``websocket`` connection here.  A socket
+at ``/ws/chat/<pet_id>/<other_user_id>/`` is authenticated from the
+session cookie and authorized like the ``chatroom`` view.  It then
+relays the conversation's broker channel to the client, and stores each
+``{"message": "..."}`` frame it receives through ``chat.send_message``.
+Frames sent to the client are the ``chat.serialize_message`` JSON of
+each new message, including the sender's own; delivering one moves the
+client's read cursor past it.
+"""
+import asyncio
+import json
+import re
+from http.cookies import SimpleCookie
+from importlib import import_module
+from types import SimpleNamespace
+from urllib.parse import urlsplit
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.db import close_old_connections
+
+from . import chat
+from .broker import get_broker
+
+CHAT_PATH = re.compile(r'^/ws/chat/(?P<pet_id>\d+)/(?P<other_user_id>\d+)/$')
+MAX_MESSAGE_LENGTH = 5000
+
+# Close codes (4000-4999 are free for applications)
+CLOSE_NOT_FOUND = 4404
+CLOSE_FORBIDDEN = 4403
+
+
+def _headers(scope):
+    return {name.decode('latin1'): value.decode('latin1') for name, value in scope.get('headers', [])}
+
+
+def _origin_allowed(headers):
+    # Browsers always send Origin on WebSocket handshakes; reject cross-site ones like CsrfViewMiddleware
+    origin = headers.get('origin')
+    if origin is None:
+        return True
+    return urlsplit(origin).netloc == headers.get('host') or origin in settings.CSRF_TRUSTED_ORIGINS
+
+
+def _with_connections(func):
+    """Run ``func`` in the sync thread with fresh DB connections, as a request would."""
+    def wrapper(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(wrapper)
+
+
+@_with_connections
+def _authorize(headers, pet_id, other_user_id):
+    """Return (user, pet, other, conversation key) for an allowed conversation, or None."""
+    cookie = SimpleCookie(headers.get('cookie', ''))
+    morsel = cookie.get(settings.SESSION_COOKIE_NAME)
+    if morsel is None:
+        return None
+    session = import_module(settings.SESSION_ENGINE).SessionStore(morsel.value)
+    user = get_user(SimpleNamespace(session=session))
+    if not user.is_authenticated:
+        return None
+    conversation = chat.open_conversation(user, pet_id, other_user_id)
+    return (user, *conversation) if conversation else None
+
+
+_send_message = _with_connections(chat.send_message)
+_mark_read = _with_connections(chat.mark_read)
+
+
+async def chat_socket(scope, receive, send, pet_id, other_user_id):
+    if (await receive())['type'] != 'websocket.connect':
+        return
+    headers = _headers(scope)
+    allowed = _origin_allowed(headers) and await _authorize(headers, pet_id, other_user_id)
+    if not allowed:
+        await send({'type': 'websocket.close', 'code': CLOSE_FORBIDDEN})
+        return
+    user, pet, other, key = allowed
+
+    async with get_broker().subscribe(chat.channel_name(key)) as subscription:
+        await send({'type': 'websocket.accept'})
+        incoming = asyncio.ensure_future(receive())
+        outgoing = asyncio.ensure_future(subscription.get())
+        try:
+            while True:
+                done, _ = await asyncio.wait({incoming, outgoing}, return_when=asyncio.FIRST_COMPLETED)
+                if outgoing in done:
+                    message = outgoing.result()
+                    await send({'type': 'websocket.send', 'text': json.dumps(message)})
+                    if message['sender_id'] != user.id:
+                        await _mark_read(key, user, message['id'])
+                    outgoing = asyncio.ensure_future(subscription.get())
+                if incoming in done:
+                    event = incoming.result()
+                    if event['type'] == 'websocket.disconnect':
+                        break
+                    content = _frame_message(event)
+                    if content:
+                        await _send_message(pet, user, other, content)
+                    incoming = asyncio.ensure_future(receive())
+        finally:
+            incoming.cancel()
+            outgoing.cancel()
+
+
+def _frame_message(event):
+    try:
+        data = json.loads(event.get('text') or '')
+    except ValueError:
+        return ''
+    content = data.get('message') if isinstance(data, dict) else None
+    if not isinstance(content, str):
+        return ''
+    return content.strip()[:MAX_MESSAGE_LENGTH]
+
+
+async def websocket_application(scope, receive, send):
+    match = CHAT_PATH.match(scope['path'])
+    if match is None:
+        await receive()
+        await send({'type': 'websocket.close', 'code': CLOSE_NOT_FOUND})
+        return
+    await chat_socket(scope, receive, send, int(match['pet_id']), int(match['other_user_id']))
@@ -0,0 +1,20 @@
+"""
+Template context shared by every page.
+
+Values are lazy: the query behind ``unread_chat_count`` only runs on pages
+whose template actually renders it, so the rest pay nothing.
+"""
+from django.utils.functional import SimpleLazyObject
+
+from . import chat
+
+
+def unread_chats(request):
+    """``unread_chat_count``: unread messages in the user's conversations as a seller."""
+    def count():
+        user = getattr(request, 'user', None)
+        if user is None or not user.is_authenticated:
+            return 0
+        return sum(chat.unread_counts(user, 'seller').values())
+
+    return {'unread_chat_count': SimpleLazyObject(count)}
@@ -0,0 +1,79 @@
+"""
+Near-duplicate pet photos via a perceptual difference hash (dHash).
+
+Each processed Pet.image gets a 64-bit dHash: the picture shrunk to 9x8
+greys, one bit per horizontally adjacent pair.  Re-encoded, resized or
+lightly edited copies of a photo land within a few bits of each other.
+
+To find hashes within ``MAX_DISTANCE`` bits without scanning every pet,
+the hash is also stored as four indexed 16-bit bands.  Two hashes that
+differ in at most 3 bits must agree exactly on at least one of the four
+bands (pigeonhole), so one OR of four indexed equality lookups yields a
+small candidate set that is then checked bit by bit.
+"""
+from django.db.models import Q
+from PIL import Image
+
+from .models import Pet
+
+HASH_SIZE = 8
+BANDS = 4
+BAND_BITS = 64 // BANDS
+MAX_DISTANCE = BANDS - 1  # the largest distance the band lookup is exact for
+BAND_FIELDS = tuple(f'dhash_band{band}' for band in range(BANDS))
+
+_UNSIGNED = 1 << 64
+_SIGNED_MAX = 1 << 63
+
+
+def dhash(image):
+    """The 64-bit difference hash of a PIL image, as an unsigned int."""
+    pixels = list(image.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS).getdata())
+    value = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for column in range(HASH_SIZE):
+            value = (value << 1) | (pixels[offset + column] > pixels[offset + column + 1])
+    return value
+
+
+def bands(value):
+    mask = (1 << BAND_BITS) - 1
+    return [(value >> (band * BAND_BITS)) & mask for band in range(BANDS)]
+
+
+def hash_fields(image):
+    """Column values for Pet.dhash and its bands. dhash is stored signed to fit a BIGINT."""
+    value = dhash(image)
+    fields = dict(zip(BAND_FIELDS, bands(value)))
+    fields['dhash'] = value - _UNSIGNED if value >= _SIGNED_MAX else value
+    return fields
+
+
+def distance(a, b):
+    return ((a ^ b) % _UNSIGNED).bit_count()
+
+
+def find_near_duplicates(pets, max_distance=MAX_DISTANCE):
+    """Map each pet's id to the other pets whose photo is within ``max_distance`` bits.
+
+    One query for any number of pets; pets without a hash are skipped.
+    """
+    hashed = [pet for pet in pets if pet.dhash is not None]
+    if not hashed:
+        return {}
+
+    condition = Q()
+    for field in BAND_FIELDS:
+        condition |= Q(**{f'{field}__in': {getattr(pet, field) for pet in hashed}})
+    candidates = list(Pet.objects.filter(condition).only('id', 'name', 'is_approved', 'dhash', *BAND_FIELDS))
+
+    duplicates = {}
+    for pet in hashed:
+        matches = [
+            other for other in candidates
+            if other.id != pet.id and distance(other.dhash, pet.dhash) <= max_distance
+        ]
+        if matches:
+            duplicates[pet.id] = matches
+    return duplicates
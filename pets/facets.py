@@ -0,0 +1,119 @@
+"""
+Facet counts for the pet catalog filters.
+
+All facets are computed from one GROUP BY over (pet_type, gender, breed,
+age bucket, in age range) and rolled up in Python.  Each facet ignores
+its own selection - the text facets their value, the age buckets the age
+range - so the counts show what the visitor would get by switching that
+filter, while still honouring every other active filter.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import BooleanField, Case, Count, Q, Value, When
+
+from . import catalog
+from .models import Pet
+
+# (label, min age, max age) - ages are inclusive, None means unbounded
+AGE_BUCKETS = [
+    ('0-1', 0, 1),
+    ('2-4', 2, 4),
+    ('5-9', 5, 9),
+    ('10+', 10, None),
+]
+
+TEXT_FACETS = ('pet_type', 'gender', 'breed')
+
+CACHE_TIMEOUT = getattr(settings, 'PET_FACET_CACHE_TIMEOUT', 30)
+
+
+def _age_bucket_expression():
+    whens = []
+    for label, low, high in AGE_BUCKETS:
+        lookups = {'age__gte': low}
+        if high is not None:
+            lookups['age__lte'] = high
+        whens.append(When(then=Value(label), **lookups))
+    return Case(*whens, default=Value(''))
+
+
+def _age_range_expression(filters):
+    lookups = {}
+    if 'age_min' in filters:
+        lookups['age__gte'] = filters['age_min']
+    if 'age_max' in filters:
+        lookups['age__lte'] = filters['age_max']
+    if not lookups:
+        return Value(True)
+    return Case(When(Q(**lookups), then=Value(True)), default=Value(False), output_field=BooleanField())
+
+
+def compute_facets(queryset, filters, query=''):
+    """
+    Return facet counts for ``queryset`` under ``filters`` using a single query.
+
+    ``query`` is the active search, kept in the age bucket links.
+    """
+    # Adoption status narrows every facet, so it goes into SQL.
+    shared = {'is_adopted': filters['is_adopted']} if 'is_adopted' in filters else {}
+    rows = (
+        catalog.apply_filters(queryset, shared)
+        .annotate(age_bucket=_age_bucket_expression(), in_age_range=_age_range_expression(filters))
+        .values(*TEXT_FACETS, 'age_bucket', 'in_age_range')
+        .annotate(n=Count('id'))
+        .order_by()
+    )
+
+    counts = {name: {} for name in TEXT_FACETS + ('age_bucket',)}
+    for row in rows:
+        mismatched = [name for name in TEXT_FACETS if name in filters and row[name] != filters[name]]
+        if not row['in_age_range']:
+            mismatched.append('age_bucket')
+        for name in TEXT_FACETS:
+            if not mismatched or mismatched == [name]:
+                counts[name][row[name]] = counts[name].get(row[name], 0) + row['n']
+        if not mismatched or mismatched == ['age_bucket']:
+            counts['age_bucket'][row['age_bucket']] = counts['age_bucket'].get(row['age_bucket'], 0) + row['n']
+
+    facets = {}
+    for name in TEXT_FACETS:
+        if name in filters:
+            counts[name].setdefault(filters[name], 0)
+        facets[name] = [
+            {'value': value, 'count': count}
+            for value, count in sorted(counts[name].items(), key=lambda item: (-item[1], item[0]))
+        ]
+
+    facets['age'] = []
+    for label, low, high in AGE_BUCKETS:
+        bucket_filters = dict(filters, age_min=low)
+        bucket_filters.pop('age_max', None)
+        if high is not None:
+            bucket_filters['age_max'] = high
+        facets['age'].append({
+            'label': label,
+            'count': counts['age_bucket'].get(label, 0),
+            'query': catalog.filters_querystring(bucket_filters, q=query or None),
+        })
+    return facets
+
+
+def _cache_key(filters, query):
+    normalized = json.dumps([filters, query], sort_keys=True)
+    return 'pets:facets:' + hashlib.sha1(normalized.encode()).hexdigest()
+
+
+def catalog_facets(filters, query='', use_cache=True):
+    """Facet counts for the approved-pet catalog, cached briefly per normalized filter set."""
+    if not use_cache or not CACHE_TIMEOUT:
+        return compute_facets(Pet.objects.filter(is_approved=True), filters, query)
+
+    key = _cache_key(filters, query)
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(Pet.objects.filter(is_approved=True), filters, query)
+        cache.set(key, facets, CACHE_TIMEOUT)
+    return facets
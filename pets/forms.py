@@ -72,9 +72,9 @@ class FeedbackForm(forms.ModelForm):
 class MessageForm(forms.ModelForm):
     class Meta:
         model = Message
-        fields = ['message']
+        fields = ['content']
         widgets = {
-            'message': forms.Textarea(attrs={'rows': 3, 'placeholder': 'Type your message...'}),
+            'content': forms.Textarea(attrs={'rows': 3, 'placeholder': 'Type your message...'}),
         }
 
 
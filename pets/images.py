@@ -0,0 +1,243 @@
+"""
+Upload pipeline for Pet.image and Product.image.
+
+Every new upload is normalised once: the original is rotated upright,
+capped at ``MAX_ORIGINAL_SIZE`` and re-encoded without its EXIF block, and
+fixed-size WebP renditions are written next to it.  The rendition names
+and widths are kept in the model's ``image_renditions`` JSON so templates
+can build ``src``/``srcset`` without touching storage.  A srcset only ever
+lists one crop (``SRCSETS``): the same picture at several widths, which is
+what browsers assume when they pick a candidate::
+
+    <img src="{{ pet.card_url }}" srcset="{{ pet.card_srcset }}" sizes="400px">
+
+Processing also stores ``image_placeholder``, a data URI of a tiny
+blurred-by-upscaling WebP (a few hundred bytes) that list templates inline
+as the ``<img>`` background while the real, lazy-loaded image arrives.
+
+Saving a model only queues the work (pets/jobs.py); until the worker has
+run, the ``*_url`` helpers return ``PLACEHOLDER_IMAGE``.
+
+Both models store their files content-addressed (pets/storage.py), so an
+upload that is already stored reuses the existing renditions, and files
+are never deleted here: pets/blobs.py reference-counts them.
+"""
+import base64
+import io
+import logging
+import posixpath
+
+from django.core.files.base import ContentFile
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.templatetags.static import static
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# name -> (width, height, crop to exactly that box)
+RENDITIONS = {
+    'thumb': (160, 160, True),
+    'thumb_2x': (320, 320, True),
+    'card': (400, 300, True),
+    'card_2x': (800, 600, True),
+    'detail_sm': (320, 240, False),
+    'detail_md': (640, 480, False),
+    'detail': (1024, 768, False),
+}
+# Width ladders of renditions sharing one crop and aspect ratio, keyed by the
+# rendition used as ``src``.  Larger cropped rungs are skipped for uploads too
+# small to fill them.
+SRCSETS = {
+    'thumb': ('thumb', 'thumb_2x'),
+    'card': ('card', 'card_2x'),
+    'detail': ('detail_sm', 'detail_md', 'detail'),
+}
+RENDITION_DIR = 'renditions'
+WEBP_QUALITY = 80
+
+PLACEHOLDER_IMAGE = 'image/paw.png'
+
+# Inline low-quality image placeholder
+LQIP_WIDTH = 16
+LQIP_QUALITY = 40
+
+MAX_ORIGINAL_SIZE = (2048, 2048)
+ORIGINAL_FORMATS = {'JPEG', 'PNG', 'WEBP'}
+
+
+class ImageRenditionsMixin:
+    """Template helpers for models with an ``image`` field and ``image_renditions`` JSON."""
+
+    # Extra columns derived from the decoded image by image_fields()
+    IMAGE_FIELDS = ('image_placeholder',)
+
+    def image_fields(self, image):
+        """Column values to store alongside the renditions, computed from the upright image."""
+        return {'image_placeholder': placeholder_data_uri(image)}
+
+    @property
+    def placeholder_style(self):
+        """Inline style showing the placeholder behind an ``<img>`` until it loads."""
+        if not self.image_placeholder:
+            return ''
+        return f"background: url('{self.image_placeholder}') center / cover no-repeat;"
+
+    def rendition_url(self, name):
+        rendition = (self.image_renditions or {}).get(name)
+        if rendition:
+            return self.image.storage.url(rendition['name'])
+        return static(PLACEHOLDER_IMAGE)
+
+    @property
+    def thumb_url(self):
+        return self.rendition_url('thumb')
+
+    @property
+    def card_url(self):
+        return self.rendition_url('card')
+
+    @property
+    def detail_url(self):
+        return self.rendition_url('detail')
+
+    def srcset(self, ladder):
+        """``srcset`` of one ``SRCSETS`` ladder, without repeating a width."""
+        renditions = self.image_renditions or {}
+        candidates = {}
+        for name in SRCSETS[ladder]:
+            if name in renditions:
+                candidates.setdefault(renditions[name]['width'], renditions[name]['name'])
+        return ', '.join(f"{self.image.storage.url(name)} {width}w" for width, name in candidates.items())
+
+    @property
+    def thumb_srcset(self):
+        return self.srcset('thumb')
+
+    @property
+    def card_srcset(self):
+        return self.srcset('card')
+
+    @property
+    def detail_srcset(self):
+        return self.srcset('detail')
+
+
+def _rgb(image):
+    if image.mode in ('RGB', 'RGBA'):
+        return image
+    return image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+
+
+def _encode(image, image_format, **options):
+    buffer = io.BytesIO()
+    if image_format == 'JPEG':
+        image = image.convert('RGB')
+    image.save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+def _normalise_original(field, image, image_format):
+    """Re-save the original upright, within MAX_ORIGINAL_SIZE and without metadata."""
+    oversized = image.width > MAX_ORIGINAL_SIZE[0] or image.height > MAX_ORIGINAL_SIZE[1]
+    if not (oversized or image.getexif() or image_format not in ORIGINAL_FORMATS):
+        return image
+
+    upright = ImageOps.exif_transpose(image)
+    upright.thumbnail(MAX_ORIGINAL_SIZE, Image.LANCZOS)
+    if image_format not in ORIGINAL_FORMATS:
+        image_format = 'PNG' if upright.mode in ('RGBA', 'LA', 'P') else 'JPEG'
+    options = {'optimize': True} if image_format == 'PNG' else {'quality': 90}
+
+    stem = posixpath.splitext(posixpath.basename(field.name))[0]
+    extension = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp'}[image_format]
+    field.save(f'{stem}.{extension}', ContentFile(_encode(upright, image_format, **options)), save=False)
+    return upright
+
+
+def _render(image, width, height, crop):
+    if crop:
+        return ImageOps.fit(image, (width, height), Image.LANCZOS)
+    rendition = image.copy()
+    rendition.thumbnail((width, height), Image.LANCZOS)
+    return rendition
+
+
+def placeholder_data_uri(image):
+    height = max(1, round(image.height * LQIP_WIDTH / image.width))
+    tiny = image.resize((LQIP_WIDTH, height), Image.BILINEAR)
+    encoded = base64.b64encode(_encode(tiny, 'WEBP', quality=LQIP_QUALITY)).decode('ascii')
+    return f'data:image/webp;base64,{encoded}'
+
+
+def build_renditions(instance, field_name='image'):
+    """Normalise ``instance``'s upload and (re)write its renditions.
+
+    Returns the renditions dict and the decoded, upright image.
+    """
+    field = getattr(instance, field_name)
+    with field.open('rb') as source:
+        image = Image.open(source)
+        image_format = image.format
+        image.load()
+
+    image = _rgb(_normalise_original(field, image, image_format))
+    renditions = {'source': field.name}
+    for name, (width, height, crop) in RENDITIONS.items():
+        if crop and name not in SRCSETS and (image.width < width or image.height < height):
+            continue
+        rendition = _render(image, width, height, crop)
+        path = posixpath.join(RENDITION_DIR, name, f'{posixpath.basename(field.name)}.webp')
+        saved = field.storage.save(path, ContentFile(_encode(rendition, 'WEBP', quality=WEBP_QUALITY)))
+        renditions[name] = {'name': saved, 'width': rendition.width}
+    return renditions, image
+
+
+def renditions_outdated(instance):
+    return bool(instance.image) and (instance.image_renditions or {}).get('source') != instance.image.name
+
+
+def image_fields_missing(instance):
+    return bool(instance.image) and any(getattr(instance, field) in (None, '') for field in instance.IMAGE_FIELDS)
+
+
+def process_image(instance, reuse=True):
+    """Bring ``instance``'s renditions up to date without re-running its save() signals."""
+    from .blobs import sync_references
+    from .caching import invalidate_latest_pets
+
+    model = type(instance)
+    values = None
+    if reuse:
+        # Identical bytes were already processed for another row: share its results
+        values = (
+            model.objects.filter(image_renditions__source=instance.image.name)
+            .filter(**{f'{field}__isnull': False for field in model.IMAGE_FIELDS})
+            .exclude(pk=instance.pk)
+            .values('image_renditions', *model.IMAGE_FIELDS).first()
+        )
+    if values is None:
+        try:
+            renditions, image = build_renditions(instance)
+            values = {'image_renditions': renditions, **instance.image_fields(image)}
+        except (OSError, ValueError, Image.DecompressionBombError):
+            logger.exception("Could not process %s image %r", instance._meta.label, instance.image.name)
+            return False
+    for field, value in values.items():
+        setattr(instance, field, value)
+    model.objects.filter(pk=instance.pk).update(image=instance.image.name, **values)
+    sync_references(instance)
+    if model._meta.label == 'pets.Pet' and model.objects.filter(pk=instance.pk, is_approved=True).exists():
+        # The dashboard's cached pets carry their rendition URLs and placeholder;
+        # only approved pets are among them (read fresh: approval may have raced the job)
+        invalidate_latest_pets()
+    return True
+
+
+@receiver(post_save, sender='pets.Pet')
+@receiver(post_save, sender='pets.Product')
+def queue_uploaded_image(sender, instance, raw=False, **kwargs):
+    from .jobs import enqueue_image_job
+
+    if not raw and renditions_outdated(instance):
+        enqueue_image_job(instance)
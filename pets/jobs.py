@@ -0,0 +1,81 @@
+"""
+Database-backed queue for image post-processing.
+
+Uploads only insert an ``ImageJob`` row; ``manage.py process_image_jobs``
+claims pending jobs and runs them in a process pool, so resizing never
+happens inside a web request.  A claim is one conditional UPDATE that
+stamps the rows with the worker's token, so several workers can share the
+queue without running a job twice.  Until its job has run, a pet shows
+the placeholder image (see ``ImageRenditionsMixin``).
+"""
+import logging
+import uuid
+from datetime import timedelta
+
+from django.apps import apps
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .images import process_image
+from .models import ImageJob
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 3
+STALE_AFTER = timedelta(minutes=10)
+
+
+def enqueue_image_job(instance):
+    job, _ = ImageJob.objects.get_or_create(
+        model=instance._meta.label, object_id=instance.pk, status='pending',
+    )
+    return job
+
+
+def new_worker_token():
+    return uuid.uuid4().hex
+
+
+def claim_jobs(worker, limit):
+    """Mark up to ``limit`` pending jobs as running for ``worker`` and return their ids."""
+    pending = ImageJob.objects.filter(status='pending').order_by('id').values('id')[:limit]
+    with transaction.atomic():
+        claimed = ImageJob.objects.filter(id__in=pending, status='pending').update(
+            status='running', worker=worker, attempts=F('attempts') + 1, updated_at=timezone.now(),
+        )
+    if not claimed:
+        return []
+    return list(ImageJob.objects.filter(status='running', worker=worker).values_list('id', flat=True))
+
+
+def requeue_stale_jobs():
+    """Put back jobs whose worker died mid-run."""
+    return ImageJob.objects.filter(
+        status='running', updated_at__lt=timezone.now() - STALE_AFTER,
+    ).update(status='pending', worker='')
+
+
+def run_job(job_id):
+    """Process one claimed job; runs inside a pool worker process."""
+    job = ImageJob.objects.get(pk=job_id)
+    model = apps.get_model(job.model)
+    instance = model.objects.filter(pk=job.object_id).first()
+    if instance is None or not instance.image:
+        ok, error = True, ''
+    else:
+        try:
+            ok = process_image(instance)
+            error = '' if ok else 'Image could not be decoded.'
+        except Exception as exc:  # keep the worker alive; the job records the failure
+            logger.exception("Image job %s failed", job_id)
+            ok, error = False, repr(exc)
+
+    if ok:
+        status = 'done'
+    elif job.attempts < MAX_ATTEMPTS:
+        status = 'pending'
+    else:
+        status = 'failed'
+    ImageJob.objects.filter(pk=job_id).update(status=status, error=error, worker='', updated_at=timezone.now())
+    return job_id, status
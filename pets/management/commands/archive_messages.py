@@ -0,0 +1,40 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from pets import archive
+from pets.models import Message
+
+
+class Command(BaseCommand):
+    help = ("Move chat messages older than CHAT_ARCHIVE_DAYS, or about adopted pets, "
+            "into compressed archive segments.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help=f"Archive messages older than this many days (default: CHAT_ARCHIVE_DAYS, "
+                                 f"{archive.DEFAULT_ARCHIVE_DAYS}).")
+        parser.add_argument('--skip-adopted', action='store_true',
+                            help="Leave recent conversations about adopted pets in the hot table.")
+        parser.add_argument('--segment-size', type=int, default=archive.SEGMENT_SIZE,
+                            help="Messages per archive segment, each written in its own transaction.")
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would be archived.")
+
+    def handle(self, *args, **options):
+        days = archive.archive_days() if options['days'] is None else options['days']
+        adopted = not options['skip_adopted']
+
+        if options['dry_run']:
+            boundaries = archive.archive_boundaries(timezone.now() - timedelta(days=days), adopted)
+            messages = sum(
+                Message.objects.filter(conversation_id=conversation_id, id__lte=boundary).count()
+                for conversation_id, boundary in boundaries.items()
+            )
+            self.stdout.write(f"Would archive {messages} message(s) from {len(boundaries)} conversation(s).")
+            return
+
+        conversations, messages = archive.archive_messages(days, adopted, options['segment_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {messages} message(s) from {conversations} conversation(s)."
+        ))
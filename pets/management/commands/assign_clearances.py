@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from pets import scheduling
+
+
+class Command(BaseCommand):
+    help = "Assign pending doctor clearance requests to the least-loaded active doctors."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=scheduling.ASSIGN_BATCH_SIZE,
+                            help="Requests assigned per round.")
+        parser.add_argument('--poll-interval', type=float, default=30.0,
+                            help="Seconds to sleep when nothing is waiting.")
+        parser.add_argument('--once', action='store_true', help="Exit once no request can be assigned.")
+
+    def handle(self, *args, **options):
+        while True:
+            released = scheduling.release_unavailable()
+            if released:
+                self.stdout.write(f"Released {released} request(s) from unavailable doctors.")
+            claimed = scheduling.assign_pending(options['batch_size'])
+            if claimed:
+                self.stdout.write(f"Assigned {claimed} clearance request(s).")
+                continue
+            if options['once']:
+                break
+            time.sleep(options['poll_interval'])
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from pets import images
+from pets.models import Pet, Product
+
+
+class Command(BaseCommand):
+    help = ("Generate WebP renditions (and derived columns such as Pet.dhash) for pet and product "
+            "images that don't have current ones.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Rebuild renditions for every image.")
+
+    def handle(self, *args, **options):
+        processed = failed = 0
+        for model in (Pet, Product):
+            for instance in model.objects.exclude(image='').exclude(image__isnull=True).iterator():
+                missing = images.image_fields_missing(instance)
+                if not options['force'] and not missing and not images.renditions_outdated(instance):
+                    continue
+                # Rows sharing this image may lack the same columns, so only reuse complete results
+                if images.process_image(instance, reuse=not (options['force'] or missing)):
+                    processed += 1
+                else:
+                    failed += 1
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} image(s), {failed} failed."))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from pets import recommendations
+
+
+class Command(BaseCommand):
+    help = "Recompute the precomputed similar-pet recommendations shown on pet detail pages."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=recommendations.TOP_K,
+                            help="Recommendations stored per pet.")
+        parser.add_argument('--block-size', type=int, default=recommendations.BLOCK_SIZE,
+                            help="Pets scored per NumPy block; lower it to save memory.")
+
+    def handle(self, *args, **options):
+        written = recommendations.build_similar_pets(options['top_k'], options['block_size'])
+        self.stdout.write(self.style.SUCCESS(f"Stored {written} similar-pet recommendations."))
@@ -0,0 +1,215 @@
+import logging
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client, TestCase
+from django.test.utils import (
+    override_settings, setup_databases, setup_test_environment,
+    teardown_databases, teardown_test_environment,
+)
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+from PIL import Image
+
+from pets import urls as pets_urls
+from pets.budgets import BUDGETS, QueryRecorder, over_budget, recording
+from pets.duplicates import hash_fields
+from pets.models import (
+    AdoptionRequest, BuyerRequest, Conversation, DoctorClearanceRequest, Feedback,
+    Message, Pet, Profile, SellerRequest,
+)
+
+# Routes exercised with a POST (and this form data) instead of a GET
+POST_DATA = {
+    'chatroom': {'message': 'Is she still available?'},
+    'add_pets': {'name': 'Budget', 'pet_type': 'Dog', 'breed': 'Beagle', 'age': 3,
+                 'gender': 'Male', 'description': 'Seeded by check_query_budgets.'},
+    'submit_feedback': {'name': 'Budget', 'email': 'budget@example.com', 'message': 'Great site'},
+    'update_pet_status': {'action': 'approve'},
+    'mark_as_adopted': {},
+    'approve_pet': {},
+    'reject_pet': {},
+    'update_buyer_request_status': {},
+    'update_seller_request_status': {},
+    'update_clearance_status': {},
+}
+
+# Routes that only make sense for a particular seeded user (default: buyer)
+ROUTE_USERS = {
+    'doctor_home': 'doctor',
+    'seller_chat_list': 'seller',
+    'view_my_pets': 'seller',
+    'mark_as_adopted': 'seller',
+    'update_buyer_request_status': 'seller',
+    'update_seller_request_status': 'doctor',
+    'update_clearance_status': 'doctor',
+    'bulk_update_requests': 'doctor',
+    'bulk_moderate_pets': 'admin',
+}
+
+
+def seed(pet_count, message_count):
+    """Create the users, pets, conversations and request queues the routes are replayed against."""
+    users = {}
+    for role in ('seller', 'buyer', 'doctor', 'admin', 'spare'):
+        user = User.objects.create_user(role, f'{role}@example.com', 'budget-password')
+        Profile.objects.create(user=user, role=role if role in ('doctor', 'admin') else 'user')
+        users[role] = user
+    seller, buyer = users['seller'], users['buyer']
+
+    pet_types = ['Dog', 'Cat', 'Bird', 'Other']
+    # A few photos shared between pets, so moderation finds duplicates
+    photos = [hash_fields(Image.linear_gradient('L').rotate(angle)) for angle in range(10, 290, 40)]
+    Pet.objects.bulk_create([
+        Pet(
+            name=f'Pet {i}', pet_type=pet_types[i % 4], breed=f'Breed {i % 12}', age=i % 15,
+            gender=['Male', 'Female'][i % 2], owner=seller, seller=seller,
+            is_approved=i % 5 != 0, description='A friendly companion. ' * 20,
+            **photos[i % len(photos)],
+        )
+        for i in range(pet_count)
+    ])
+    pets = list(Pet.objects.order_by('id'))
+    pet = next(p for p in pets if p.is_approved)
+    pending_pet = next(p for p in pets if not p.is_approved)
+
+    conversation = Conversation.objects.create(
+        pet=pet, buyer=buyer, seller=seller, message_count=message_count,
+        last_message_at=timezone.now(), last_message=f'Message {message_count - 1}',
+    )
+    Message.objects.bulk_create([
+        Message(
+            pet=pet, sender=buyer if i % 2 else seller, receiver=seller if i % 2 else buyer,
+            content=f'Message {i}', conversation=conversation,
+        )
+        for i in range(message_count)
+    ])
+    # More than a page of conversations in the seller's inbox
+    Conversation.objects.bulk_create([
+        Conversation(
+            pet=p, buyer=buyer, seller=seller, message_count=1,
+            last_message_at=timezone.now(), last_message='Is this pet still available?',
+        )
+        for p in pets if p.is_approved and p.id != pet.id
+    ][:40])
+    for p in pets[:50]:
+        SellerRequest.objects.create(seller=seller, pet=p)
+        BuyerRequest.objects.create(buyer=buyer, pet=p)
+        AdoptionRequest.objects.create(user=buyer, pet=p)
+        DoctorClearanceRequest.objects.create(pet=p, requested_by=buyer, doctor=users['doctor'])
+    Feedback.objects.bulk_create([Feedback(name=f'User {i}', message='Thanks!') for i in range(50)])
+
+    return {
+        'users': users,
+        'kwargs': {
+            'pet_id': pet.id,
+            'other_user_id': seller.id,
+            'message_id': Message.objects.filter(sender=buyer).values_list('id', flat=True).first(),
+            'status': 'Approved',
+            'user_id': users['spare'].id,
+            'id': users['doctor'].profile.id,
+            'token': 'not-a-token',
+        },
+        'route_kwargs': {
+            'view_seller_request': {'request_id': SellerRequest.objects.first().id},
+            'update_buyer_request_status': {'request_id': BuyerRequest.objects.first().id},
+            'update_seller_request_status': {'request_id': SellerRequest.objects.first().id},
+            'update_clearance_status': {'request_id': DoctorClearanceRequest.objects.first().id},
+            'bulk_update_requests': {'queue': 'clearance'},
+            'approve_pet': {'pet_id': pending_pet.id},
+            'reject_pet': {'pet_id': pending_pet.id},
+        },
+        'post_data': {
+            'bulk_moderate_pets': {
+                'action': 'reject',
+                'pet_ids': [p.id for p in pets if not p.is_approved][:20],
+            },
+            'bulk_update_requests': {
+                'status': 'Approved',
+                'request_ids': list(DoctorClearanceRequest.objects.values_list('id', flat=True)[:20]),
+            },
+        },
+    }
+
+
+def named_routes():
+    """Every named URL pattern in pets/urls.py."""
+    return [pattern for pattern in pets_urls.urlpatterns if isinstance(pattern, URLPattern) and pattern.name]
+
+
+def login_clients(users):
+    clients = {}
+    for name, user in users.items():
+        clients[name] = Client(raise_request_exception=False)
+        clients[name].force_login(user)
+    return clients
+
+
+def replay(fixtures, clients, pattern):
+    """Request one route as its seeded user and roll it back. Returns (url, response, QueryRecorder)."""
+    name = pattern.name
+    values = {**fixtures['kwargs'], **fixtures['route_kwargs'].get(name, {})}
+    kwargs = {key: values[key] for key in pattern.pattern.converters}
+    url = reverse(name, kwargs=kwargs)
+    client = clients[ROUTE_USERS.get(name, 'buyer')]
+
+    recorder = QueryRecorder()
+    # Roll every request back so destructive routes don't change the dataset for the next one.
+    # on_commit callbacks (cache invalidation, chat pushes) still run, and are counted.
+    with transaction.atomic():
+        with recording(recorder), TestCase.captureOnCommitCallbacks(execute=True):
+            data = fixtures['post_data'].get(name, POST_DATA.get(name))
+            if data is not None:
+                response = client.post(url, data)
+            else:
+                response = client.get(url)
+        transaction.set_rollback(True)
+    return url, response, recorder
+
+
+class Command(BaseCommand):
+    help = "Replay every pets route against a seeded test database and fail on views over their query budget."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pets', type=int, default=300, help="Number of pets to seed.")
+        parser.add_argument('--messages', type=int, default=200, help="Messages in the seeded conversation.")
+
+    def handle(self, *args, **options):
+        # This command reports overruns itself; keep the middleware's log lines out of its output.
+        logging.getLogger('pets.budgets').setLevel(logging.ERROR)
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False, aliases={'default', 'cache'})
+        try:
+            with override_settings(
+                EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+                PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+            ):
+                fixtures = seed(options['pets'], options['messages'])
+                failures = self.check_routes(fixtures)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        if failures:
+            raise CommandError(f"{len(failures)} route(s) over budget:\n" + '\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS("All pets routes are within their query budgets."))
+
+    def check_routes(self, fixtures):
+        failures = []
+        clients = login_clients(fixtures['users'])
+        for pattern in named_routes():
+            name = pattern.name
+            if name not in BUDGETS:
+                failures.append(f"{name}: no budget registered in pets/budgets.py")
+                continue
+
+            url, response, recorder = replay(fixtures, clients, pattern)
+            self.stdout.write(f"{name:32} {response.status_code}  {recorder.count:3d} queries  {recorder.duration_ms:6.1f}ms")
+            if response.status_code >= 500:
+                failures.append(f"{name}: {url} returned {response.status_code}")
+                continue
+            problem = over_budget(name, recorder)
+            if problem:
+                failures.append(f"{name}: {url} used {problem}")
+        return failures
@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from pets import blobs
+from pets.storage import content_addressed_storage, is_hashed_name
+
+
+class Command(BaseCommand):
+    help = ("Move pet and product images (and their renditions) into content-addressed storage, "
+            "merging byte-identical copies, then recount blob references.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would be merged.")
+        parser.add_argument('--collect', action='store_true',
+                            help="Also delete blobs that have been unreferenced for longer than the grace period.")
+
+    def handle(self, *args, **options):
+        storage = content_addressed_storage
+        moved = {}  # legacy name -> content-addressed name
+        saved_bytes = 0
+
+        def migrate(name):
+            nonlocal saved_bytes
+            if not name or is_hashed_name(name) or not storage.exists(name):
+                return name
+            if name not in moved:
+                size = storage.size(name)
+                with storage.open(name, 'rb') as source:
+                    target = storage.hashed_name_for(source, name)
+                    if target in moved.values() or storage.exists(target):
+                        saved_bytes += size
+                    elif not options['dry_run']:
+                        target = storage.save(name, source)
+                moved[name] = target
+            return moved[name]
+
+        updated = 0
+        for model in blobs.MEDIA_MODELS:
+            for pk, image_name, renditions in model.objects.values_list('pk', 'image', 'image_renditions').iterator():
+                new_image = migrate(image_name)
+                new_renditions = {
+                    key: {**value, 'name': migrate(value['name'])} if isinstance(value, dict) else value
+                    for key, value in (renditions or {}).items()
+                }
+                if renditions and renditions.get('source') == image_name:
+                    new_renditions['source'] = new_image
+                if (new_image, new_renditions) != (image_name, renditions or {}) and not options['dry_run']:
+                    model.objects.filter(pk=pk).update(image=new_image, image_renditions=new_renditions)
+                    updated += 1
+
+        merged = len(moved) - len(set(moved.values()))
+        if options['dry_run']:
+            self.stdout.write(f"Would move {len(moved)} file(s), merging {merged} duplicate(s) "
+                              f"and saving {saved_bytes} bytes.")
+            return
+
+        # Rows now point at the content-addressed copies; the legacy files are unreferenced
+        for name, target in moved.items():
+            if name != target:
+                storage.delete(name)
+        with transaction.atomic():
+            referenced = blobs.rebuild_refcounts()
+        self.stdout.write(f"Moved {len(moved)} file(s) for {updated} row(s), merged {merged} duplicate(s), "
+                          f"saved {saved_bytes} bytes; {referenced} blob(s) referenced.")
+
+        if options['collect']:
+            files, freed = blobs.collect_garbage()
+            self.stdout.write(f"Collected {files} unreferenced blob(s), {freed} bytes.")
+        self.stdout.write(self.style.SUCCESS("Media deduplicated."))
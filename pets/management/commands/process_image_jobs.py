@@ -0,0 +1,48 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from pets import jobs
+
+
+# Database connections a forked worker inherited from the parent
+_inherited_connections = []
+
+
+def _init_worker():
+    # Spawned workers need Django configured; forked ones must not reuse the parent's connections.
+    django.setup()
+    # Closing an inherited connection would end the parent's session on the
+    # server, and so would the driver's finalizer, so detach them and keep the
+    # objects alive; forked workers leave through os._exit.
+    for conn in connections.all(initialized_only=True):
+        if conn.connection is not None:
+            _inherited_connections.append(conn.connection)
+            conn.connection = None
+
+
+class Command(BaseCommand):
+    help = "Run queued image post-processing jobs in a pool of worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help="Worker processes.")
+        parser.add_argument('--batch-size', type=int, default=8, help="Jobs claimed per round.")
+        parser.add_argument('--poll-interval', type=float, default=2.0, help="Seconds to sleep when the queue is empty.")
+        parser.add_argument('--once', action='store_true', help="Exit once the queue is drained.")
+
+    def handle(self, *args, **options):
+        worker = jobs.new_worker_token()
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=_init_worker) as pool:
+            while True:
+                jobs.requeue_stale_jobs()
+                job_ids = jobs.claim_jobs(worker, options['batch_size'])
+                if not job_ids:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+                for job_id, status in pool.map(jobs.run_job, job_ids):
+                    self.stdout.write(f"Image job {job_id}: {status}")
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from pets import queues
+
+
+class Command(BaseCommand):
+    help = "Recount the per-status request totals shown on the admin and doctor dashboards."
+
+    def handle(self, *args, **options):
+        total = queues.rebuild_status_counts()
+        self.stdout.write(self.style.SUCCESS(f"Recounted {total} request(s) across {len(queues.QUEUES)} queue(s)."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from pets import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the pet full-text search index from the pets_pet table."
+
+    def handle(self, *args, **options):
+        search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS("Pet search index rebuilt."))
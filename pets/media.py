@@ -0,0 +1,186 @@
+"""
+Production handler for MEDIA_URL.
+
+Serves uploaded files straight from MEDIA_ROOT with what browsers and CDNs
+need to cache them: a strong ETag and Last-Modified for conditional GETs
+(answered with 304 without opening the file), single byte ranges (206/416,
+honouring If-Range), and far-future ``immutable`` caching for
+content-addressed names (pets/storage.py), whose bytes can never change.
+
+``middleware.MediaMiddleware`` calls ``serve_media`` ahead of the session,
+auth and message middleware, so these public responses never carry a
+session cookie or ``Vary: Cookie``.
+
+How the bytes go out depends on the server.  Under WSGI (gunicorn) whole
+files and open-ended ranges are a FileResponse on the open file, so
+``wsgi.file_wrapper`` can sendfile() them.  The Procfile's web process is
+uvicorn, and ASGI has no sendfile: Django would read a FileResponse into
+memory in one piece before sending it.  There the file is streamed through
+an async iterator instead, ``STREAM_BLOCK_SIZE`` at a time, each read done
+in a worker thread.  Either way the long-lived caching headers are what
+keep repeat traffic off this view, since a CDN or proxy in front can answer
+from its own copy.
+"""
+import mimetypes
+import os
+import posixpath
+import re
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+from .storage import is_hashed_name
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+MUTABLE_CACHE_CONTROL = 'public, max-age=3600'
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+STREAM_BLOCK_SIZE = 64 * 1024
+
+
+class _RangeFile:
+    """Read at most ``length`` bytes of ``file`` starting at ``start``."""
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        size = self.remaining if size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+async def _stream(file):
+    """Yield ``file`` in ``STREAM_BLOCK_SIZE`` chunks, reading off the event loop."""
+    read = sync_to_async(file.read, thread_sensitive=False)
+    try:
+        while chunk := await read(STREAM_BLOCK_SIZE):
+            yield chunk
+    finally:
+        file.close()
+
+
+def _file_response(request, file, content_type):
+    if isinstance(request, ASGIRequest):
+        return StreamingHttpResponse(_stream(file), content_type=content_type)
+    return FileResponse(file, content_type=content_type)
+
+
+def _etag(path, stat):
+    if is_hashed_name(path):
+        # The name is the SHA-256 of the content
+        return '"%s"' % posixpath.splitext(posixpath.basename(path))[0]
+    return '"%x-%x"' % (stat.st_mtime_ns, stat.st_size)
+
+
+def parse_range(header, size):
+    """Return (start, end) inclusive for a single satisfiable byte range, None to
+    ignore the header, or False if the range cannot be satisfied."""
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        # Malformed or multi-range: serve the whole file
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if not length:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or (last and int(last) < start):
+        return False
+    return start, end
+
+
+def _if_range_matches(request, etag, last_modified):
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+@require_safe
+def serve_media(request, path):
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404("File not found")
+    try:
+        stat = os.stat(full_path)
+    except OSError:
+        raise Http404("File not found")
+    if not os.path.isfile(full_path):
+        raise Http404("File not found")
+
+    etag = _etag(path, stat)
+    last_modified = int(stat.st_mtime)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(last_modified),
+        'Cache-Control': IMMUTABLE_CACHE_CONTROL if is_hashed_name(path) else MUTABLE_CACHE_CONTROL,
+        'Accept-Ranges': 'bytes',
+    }
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        for header, value in headers.items():
+            not_modified.headers.setdefault(header, value)
+        return not_modified
+
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+    size = stat.st_size
+
+    byte_range = None
+    if 'HTTP_RANGE' in request.META and _if_range_matches(request, etag, last_modified):
+        byte_range = parse_range(request.META['HTTP_RANGE'], size)
+    if byte_range is False:
+        response = HttpResponse(status=416, headers=headers)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    if request.method == 'HEAD':
+        response = HttpResponse(content_type=content_type, headers=headers)
+        response['Content-Length'] = str(size)
+        return response
+
+    file = open(full_path, 'rb')
+    if byte_range is None:
+        response = _file_response(request, file, content_type)
+        response['Content-Length'] = str(size)
+    else:
+        start, end = byte_range
+        if end == size - 1:
+            # Open-ended range: the rest of the file, still sendfile()-able under WSGI
+            file.seek(start)
+            response = _file_response(request, file, content_type)
+        else:
+            response = _file_response(request, _RangeFile(file, start, end - start + 1), content_type)
+        response.status_code = 206
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+    if encoding:
+        response['Content-Encoding'] = encoding
+    for header, value in headers.items():
+        response[header] = value
+    return response
@@ -0,0 +1,138 @@
+"""
+Project middleware.
+
+All three classes run natively in sync and async mode, like Django's own
+middleware.  A single sync-only middleware anywhere in the stack makes
+Django adapt everything below it to sync under ASGI, so an async view such
+as the chat long-poll would hold a worker thread for as long as it waits.
+"""
+import logging
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from .budgets import QueryRecorder, over_budget, recording
+from .media import serve_media
+
+logger = logging.getLogger('pets.budgets')
+
+
+def _add_execute_wrapper(wrapper):
+    for conn in connections.all():
+        conn.execute_wrappers.append(wrapper)
+
+
+def _remove_execute_wrapper(wrapper):
+    for conn in connections.all():
+        conn.execute_wrappers.remove(wrapper)
+
+
+class MediaMiddleware:
+    """Answer MEDIA_URL requests with ``media.serve_media`` before the rest of the stack runs.
+
+    Media responses are publicly cacheable.  Below this sit the session, auth
+    and message middleware; with ``SESSION_SAVE_EVERY_REQUEST`` they would save
+    the session and add ``Set-Cookie`` and ``Vary: Cookie`` to every image, and
+    a shared cache could hand one user's session cookie to others.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def media_path(request):
+        """The path below MEDIA_URL, or None for any other request."""
+        if request.path_info.startswith(settings.MEDIA_URL):
+            return request.path_info[len(settings.MEDIA_URL):] or None
+        return None
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        path = self.media_path(request)
+        if path is None:
+            return self.get_response(request)
+        return serve_media(request, path)
+
+    async def __acall__(self, request):
+        path = self.media_path(request)
+        if path is None:
+            return await self.get_response(request)
+        return await sync_to_async(serve_media)(request, path)
+
+
+class QueryBudgetMiddleware:
+    """Record the SQL count and time of every request and log views that exceed their budget."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        with recording(recorder):
+            response = self.get_response(request)
+        return self.process_response(request, response, recorder)
+
+    async def __acall__(self, request):
+        # Connections are per thread, and the request's ORM calls all run on its
+        # thread-sensitive sync_to_async thread, so the recorder goes on that one's.
+        recorder = QueryRecorder()
+        await sync_to_async(_add_execute_wrapper)(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(_remove_execute_wrapper)(recorder)
+        return self.process_response(request, response, recorder)
+
+    def process_response(self, request, response, recorder):
+        request.query_stats = recorder
+        match = request.resolver_match
+        url_name = match.url_name if match else None
+        problem = over_budget(url_name, recorder)
+        if problem:
+            logger.warning("%s %s (%s) is over budget: %s", request.method, request.path, url_name, problem)
+
+        if settings.DEBUG:
+            response['Server-Timing'] = f'db;dur={recorder.duration_ms:.1f};desc="{recorder.count} queries"'
+        return response
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """WhiteNoise, which is sync-only, with an async path that needs no thread for non-static requests."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            # Opens the file
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
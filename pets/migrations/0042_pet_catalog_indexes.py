@@ -0,0 +1,39 @@
+# Generated by Django 5.1.6 on 2026-10-18 16:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pets', '0041_rename_original_price_product_discount_price_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pet',
+            index=models.Index(fields=['is_approved', '-id'], name='pet_approved_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pet',
+            index=models.Index(fields=['is_approved', 'pet_type', '-id'], name='pet_approved_type_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pet',
+            index=models.Index(fields=['is_approved', 'breed', '-id'], name='pet_approved_breed_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pet',
+            index=models.Index(fields=['is_approved', 'gender', '-id'], name='pet_approved_gender_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pet',
+            index=models.Index(fields=['is_approved', 'is_adopted', '-id'], name='pet_approved_adopted_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pet',
+            index=models.Index(fields=['is_approved', 'age'], name='pet_approved_age_idx'),
+        ),
+    ]
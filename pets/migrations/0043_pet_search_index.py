@@ -0,0 +1,43 @@
+# Full-text search index for Pet name, breed and description (see pets/search.py)
+
+from django.db import migrations
+
+PG_VECTOR = (
+    "(setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(breed, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'C'))"
+)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE pets_pet_fts USING fts5("
+            "name, breed, description, tokenize = 'porter unicode61')"
+        )
+        schema_editor.execute(
+            "INSERT INTO pets_pet_fts (rowid, name, breed, description) "
+            "SELECT id, name, breed, description FROM pets_pet"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(f"CREATE INDEX pet_search_gin ON pets_pet USING GIN ({PG_VECTOR})")
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS pets_pet_fts")
+    elif vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS pet_search_gin")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pets', '0042_pet_catalog_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
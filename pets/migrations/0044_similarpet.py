@@ -0,0 +1,27 @@
+# Generated by Django 5.1.6 on 2026-10-18 16:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pets', '0043_pet_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarPet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('pet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_pets', to='pets.pet')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='pets.pet')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('pet', 'rank'), name='similar_pet_rank_uniq')],
+            },
+        ),
+    ]
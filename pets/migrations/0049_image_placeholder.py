@@ -0,0 +1,23 @@
+# Generated by Django 5.1.6 on 2026-10-18 16:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pets', '0048_pet_dhash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pet',
+            name='image_placeholder',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='image_placeholder',
+            field=models.TextField(blank=True, editable=False),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.6 on 2026-10-18 16:49
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pets', '0049_image_placeholder'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['pet', 'sender', 'receiver', '-id'], name='message_pair_id_idx'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Create a Conversation for every existing (pet, buyer, seller) thread and attach its messages
+
+from django.db import migrations
+
+BATCH_SIZE = 1000
+PREVIEW_LENGTH = 100
+
+
+def _preview(content):
+    content = ' '.join((content or '').split())
+    return content if len(content) <= PREVIEW_LENGTH else content[:PREVIEW_LENGTH - 1] + '…'
+
+
+def backfill_conversations(apps, schema_editor):
+    Conversation = apps.get_model('pets', 'Conversation')
+    Message = apps.get_model('pets', 'Message')
+
+    threads = {}  # (pet, buyer, seller) -> {'ids': [...], 'count', 'last_at', 'last'}
+    rows = Message.objects.order_by('id').values_list(
+        'id', 'pet_id', 'pet__owner_id', 'sender_id', 'receiver_id', 'content', 'timestamp',
+    )
+    for message_id, pet_id, owner_id, sender_id, receiver_id, content, timestamp in rows.iterator(BATCH_SIZE):
+        # The pet's owner is the seller; messages not involving the owner keep the receiver as seller
+        seller_id = owner_id if owner_id in (sender_id, receiver_id) else receiver_id
+        buyer_id = sender_id if sender_id != seller_id else receiver_id
+        thread = threads.setdefault((pet_id, buyer_id, seller_id), {'ids': []})
+        thread['ids'].append(message_id)
+        thread['last_at'], thread['last'] = timestamp, content
+
+    for (pet_id, buyer_id, seller_id), thread in threads.items():
+        conversation = Conversation.objects.create(
+            pet_id=pet_id, buyer_id=buyer_id, seller_id=seller_id,
+            last_message_at=thread['last_at'], last_message=_preview(thread['last']),
+            message_count=len(thread['ids']),
+        )
+        ids = thread['ids']
+        for start in range(0, len(ids), BATCH_SIZE):
+            Message.objects.filter(id__in=ids[start:start + BATCH_SIZE]).update(conversation=conversation)
+
+
+def detach_messages(apps, schema_editor):
+    apps.get_model('pets', 'Message').objects.update(conversation=None)
+    apps.get_model('pets', 'Conversation').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pets', '0051_conversation'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_conversations, detach_messages),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.6 on 2026-10-18 16:54
+
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def mark_history_read(apps, schema_editor):
+    # Messages sent before read cursors existed count as read by both sides
+    Conversation = apps.get_model('pets', 'Conversation')
+    Message = apps.get_model('pets', 'Message')
+    latest = Coalesce(Subquery(
+        Message.objects.filter(conversation=OuterRef('pk'))
+        .values('conversation').annotate(latest=Max('id')).values('latest')
+    ), Value(0))
+    Conversation.objects.update(buyer_last_read_id=latest, seller_last_read_id=latest)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pets', '0052_backfill_conversations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='buyer_last_read_id',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='seller_last_read_id',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.RunPython(mark_history_read, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# Copy Message.message into Message.content where content is blank, so 0055 can drop `message`.
+# Runs outside a migration-wide transaction, one short transaction per id range.
+
+from django.db import migrations, transaction
+from django.db.models import F, Max
+
+BATCH_SIZE = 1000
+PREVIEW_LENGTH = 100
+
+
+def _preview(content):
+    content = ' '.join((content or '').split())
+    return content if len(content) <= PREVIEW_LENGTH else content[:PREVIEW_LENGTH - 1] + '…'
+
+
+def merge_message_body(apps, schema_editor):
+    Conversation = apps.get_model('pets', 'Conversation')
+    Message = apps.get_model('pets', 'Message')
+    db = schema_editor.connection.alias
+
+    last_id = Message.objects.using(db).aggregate(last=Max('id'))['last'] or 0
+    for start in range(0, last_id, BATCH_SIZE):
+        with transaction.atomic(using=db):
+            Message.objects.using(db).filter(
+                id__gt=start, id__lte=start + BATCH_SIZE, content='',
+            ).exclude(message='').update(content=F('message'))
+
+    # Inbox previews taken from a blank content column
+    conversations = Conversation.objects.using(db).filter(last_message='', message_count__gt=0)
+    for conversation in conversations.iterator(BATCH_SIZE):
+        latest = Message.objects.using(db).filter(conversation=conversation).order_by('-id').first()
+        if latest is not None and latest.content:
+            Conversation.objects.using(db).filter(pk=conversation.pk).update(last_message=_preview(latest.content))
+
+
+def copy_content_back(apps, schema_editor):
+    Message = apps.get_model('pets', 'Message')
+    db = schema_editor.connection.alias
+
+    last_id = Message.objects.using(db).aggregate(last=Max('id'))['last'] or 0
+    for start in range(0, last_id, BATCH_SIZE):
+        with transaction.atomic(using=db):
+            Message.objects.using(db).filter(
+                id__gt=start, id__lte=start + BATCH_SIZE, message='',
+            ).update(message=F('content'))
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('pets', '0053_conversation_read_cursors'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_message_body, copy_content_back),
+    ]
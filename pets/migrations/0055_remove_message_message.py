@@ -0,0 +1,27 @@
+# Generated by Django 5.1.6 on 2026-10-18 16:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pets', '0054_merge_message_body'),
+    ]
+
+    operations = [
+        # A default lets the reverse migration re-add the column to existing rows.
+        # State only: altering the column on SQLite would rebuild the whole table,
+        # so the forward migration is just the DROP COLUMN below.
+        migrations.SeparateDatabaseAndState(state_operations=[
+            migrations.AlterField(
+                model_name='message',
+                name='message',
+                field=models.TextField(default=''),
+            ),
+        ]),
+        migrations.RemoveField(
+            model_name='message',
+            name='message',
+        ),
+    ]
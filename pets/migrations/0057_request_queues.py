@@ -0,0 +1,66 @@
+# Generated by Django 5.1.6 on 2026-10-18 16:59
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+STATUSES = ('Pending', 'Approved', 'Rejected')
+QUEUES = {
+    'adoption': 'AdoptionRequest',
+    'seller': 'SellerRequest',
+    'buyer': 'BuyerRequest',
+    'clearance': 'DoctorClearanceRequest',
+}
+
+
+def count_requests(apps, schema_editor):
+    RequestStatusCount = apps.get_model('pets', 'RequestStatusCount')
+    for queue, model_name in QUEUES.items():
+        model = apps.get_model('pets', model_name)
+        counts = dict(model.objects.values_list('status').annotate(count=Count('id')).order_by())
+        RequestStatusCount.objects.bulk_create([
+            RequestStatusCount(queue=queue, status=status, count=counts.get(status, 0))
+            for status in set(STATUSES) | set(counts)
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pets', '0056_message_archive'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestStatusCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('queue', models.CharField(max_length=20)),
+                ('status', models.CharField(max_length=20)),
+                ('count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='adoptionrequest',
+            index=models.Index(fields=['status', '-created_at', '-id'], name='adoptreq_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='buyerrequest',
+            index=models.Index(fields=['status', '-created_at', '-id'], name='buyerreq_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='doctorclearancerequest',
+            index=models.Index(fields=['status', '-created_at', '-id'], name='clearance_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sellerrequest',
+            index=models.Index(fields=['status', '-created_at', '-id'], name='sellerreq_status_created_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='requeststatuscount',
+            constraint=models.UniqueConstraint(fields=('queue', 'status'), name='requeststatuscount_uniq'),
+        ),
+        migrations.RunPython(count_requests, migrations.RunPython.noop),
+    ]
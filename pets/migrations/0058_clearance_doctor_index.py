@@ -0,0 +1,19 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:02
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pets', '0057_request_queues'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='doctorclearancerequest',
+            index=models.Index(fields=['doctor', 'status', '-created_at', '-id'], name='clearance_doctor_status_idx'),
+        ),
+    ]
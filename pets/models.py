@@ -1,6 +1,10 @@
 from django.db import models
 from django.contrib.auth.models import User
 
+from .images import ImageRenditionsMixin
+from .querysets import PetQuerySet, ProfileQuerySet, RequestQuerySet
+from .storage import content_addressed_storage
+
 # Profile model for role-based access
 class Profile(models.Model):
     ROLE_CHOICES = [
@@ -18,12 +22,14 @@ class Profile(models.Model):
     phone = models.CharField(max_length=15, blank=True, null=True)
     specialization = models.CharField(max_length=100, blank=True, null=True)
 
+    objects = ProfileQuerySet.as_manager()
+
     def _str_(self):
         return self.user.username if self.user else "No user assigned"
 
 
 # Pet model
-class Pet(models.Model):
+class Pet(ImageRenditionsMixin, models.Model):
     PET_TYPES = [
         ('Dog', 'Dog'),
         ('Cat', 'Cat'),
@@ -43,25 +49,176 @@ class Pet(models.Model):
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='pets_owner', null=True)
     seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name='pets_selling', null=True)
     buyer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='pets_buying', null=True)
-    image = models.ImageField(upload_to='pet_images/', blank=True, null=True)
+    image = models.ImageField(upload_to='pet_images/', storage=content_addressed_storage, blank=True, null=True)
+    image_renditions = models.JSONField(default=dict, blank=True, editable=False)
+    image_placeholder = models.TextField(blank=True, editable=False)
+    # Perceptual hash of the image and its 16-bit bands (see pets/duplicates.py)
+    dhash = models.BigIntegerField(null=True, blank=True, editable=False)
+    dhash_band0 = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    dhash_band1 = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    dhash_band2 = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    dhash_band3 = models.PositiveIntegerField(null=True, blank=True, editable=False)
     is_approved = models.BooleanField(default=False)
     is_adopted = models.BooleanField(default=False)
 
+    objects = PetQuerySet.as_manager()
+
+    IMAGE_FIELDS = ImageRenditionsMixin.IMAGE_FIELDS + (
+        'dhash', 'dhash_band0', 'dhash_band1', 'dhash_band2', 'dhash_band3',
+    )
+
+    class Meta:
+        # Composite indexes backing the keyset-paginated catalog (see pets/catalog.py)
+        indexes = [
+            models.Index(fields=['is_approved', '-id'], name='pet_approved_id_idx'),
+            models.Index(fields=['is_approved', 'pet_type', '-id'], name='pet_approved_type_id_idx'),
+            models.Index(fields=['is_approved', 'breed', '-id'], name='pet_approved_breed_id_idx'),
+            models.Index(fields=['is_approved', 'gender', '-id'], name='pet_approved_gender_id_idx'),
+            models.Index(fields=['is_approved', 'is_adopted', '-id'], name='pet_approved_adopted_id_idx'),
+            models.Index(fields=['is_approved', 'age'], name='pet_approved_age_idx'),
+            models.Index(fields=['dhash_band0'], name='pet_dhash_band0_idx'),
+            models.Index(fields=['dhash_band1'], name='pet_dhash_band1_idx'),
+            models.Index(fields=['dhash_band2'], name='pet_dhash_band2_idx'),
+            models.Index(fields=['dhash_band3'], name='pet_dhash_band3_idx'),
+        ]
+
     def _str_(self):
         return self.name
 
+    def image_fields(self, image):
+        from .duplicates import hash_fields
+
+        return {**super().image_fields(image), **hash_fields(image)}
+
+
+# SimilarPet model - precomputed recommendations (see pets/recommendations.py)
+class SimilarPet(models.Model):
+    pet = models.ForeignKey(Pet, on_delete=models.CASCADE, related_name='similar_pets')
+    similar = models.ForeignKey(Pet, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['pet', 'rank'], name='similar_pet_rank_uniq'),
+        ]
+
+    def _str_(self):
+        return f"{self.pet_id} -> {self.similar_id} (#{self.rank})"
+
+
+# ImageJob model - queue for upload post-processing (see pets/jobs.py)
+class ImageJob(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    model = models.CharField(max_length=100)
+    object_id = models.PositiveBigIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    worker = models.CharField(max_length=32, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name='imagejob_status_id_idx'),
+        ]
+
+    def _str_(self):
+        return f"{self.model} #{self.object_id} ({self.status})"
+
+
+# MediaBlob model - reference counts for content-addressed files (see pets/blobs.py)
+class MediaBlob(models.Model):
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField(default=0)
+    refcount = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['refcount', 'updated_at'], name='mediablob_refcount_idx'),
+        ]
+
+    def _str_(self):
+        return f"{self.name} ({self.refcount} refs)"
+
+
+# Conversation model - one per (pet, buyer, seller), kept current by pets/chat.py
+class Conversation(models.Model):
+    pet = models.ForeignKey(Pet, on_delete=models.CASCADE, related_name='conversations')
+    buyer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='buyer_conversations')
+    seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name='seller_conversations')
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    last_message = models.CharField(max_length=255, blank=True)
+    message_count = models.PositiveIntegerField(default=0)
+    # Read cursors: the id of the last Message each participant has seen
+    buyer_last_read_id = models.PositiveBigIntegerField(default=0)
+    seller_last_read_id = models.PositiveBigIntegerField(default=0)
+    # Messages with an id up to this one have been moved to MessageArchive
+    archived_through_id = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['pet', 'buyer', 'seller'], name='conversation_uniq'),
+        ]
+        # Inboxes, most recent conversation first
+        indexes = [
+            models.Index(fields=['seller', '-last_message_at', '-id'], name='conversation_seller_idx'),
+            models.Index(fields=['buyer', '-last_message_at', '-id'], name='conversation_buyer_idx'),
+        ]
+
+    def _str_(self):
+        return f"{self.pet} - {self.buyer} / {self.seller}"
+
 
 # Message model
 class Message(models.Model):
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
     receiver = models.ForeignKey(User, on_delete=models.CASCADE, related_name='received_messages')
-    message = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
     pet = models.ForeignKey(Pet, on_delete=models.CASCADE)
     content = models.TextField()
+    conversation = models.ForeignKey(
+        Conversation, on_delete=models.CASCADE, related_name='messages', null=True, blank=True,
+    )
+
+    class Meta:
+        # A conversation's history in id order (see pets/chat.py)
+        indexes = [
+            models.Index(fields=['conversation', '-id'], name='message_conversation_id_idx'),
+        ]
+
+    def _str_(self):
+        return f"{self.sender} to {self.receiver}: {self.content[:30]}"
+
+
+# MessageArchive model - a compressed run of a conversation's oldest messages (see pets/archive.py)
+class MessageArchive(models.Model):
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='archives')
+    first_id = models.PositiveBigIntegerField()
+    last_id = models.PositiveBigIntegerField()
+    first_at = models.DateTimeField()
+    last_at = models.DateTimeField()
+    message_count = models.PositiveIntegerField()
+    data = models.BinaryField()  # zlib-compressed JSON lines, oldest message first
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        # Paging back through a conversation's archive, newest segment first
+        indexes = [
+            models.Index(fields=['conversation', '-last_id'], name='messagearchive_conv_last_idx'),
+        ]
 
     def _str_(self):
-        return f"{self.sender} to {self.receiver}: {self.message[:30]}"
+        return f"{self.conversation_id}: messages {self.first_id}-{self.last_id}"
 
 
 # Feedback model
@@ -87,6 +244,15 @@ class AdoptionRequest(models.Model):
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='Pending')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = RequestQuerySet.as_manager()
+    LIST_USERS = ('user',)
+
+    class Meta:
+        # Work queue pages, newest first within a status (see pets/queues.py)
+        indexes = [
+            models.Index(fields=['status', '-created_at', '-id'], name='adoptreq_status_created_idx'),
+        ]
+
     def _str_(self):
         return f"{self.user.username} - {self.pet.name} ({self.status})"
 
@@ -102,6 +268,15 @@ class SellerRequest(models.Model):
         ('Rejected', 'Rejected')
     ], default='Pending')
 
+    objects = RequestQuerySet.as_manager()
+    LIST_USERS = ('seller',)
+
+    class Meta:
+        # Work queue pages, newest first within a status (see pets/queues.py)
+        indexes = [
+            models.Index(fields=['status', '-created_at', '-id'], name='sellerreq_status_created_idx'),
+        ]
+
     def _str_(self):
         return f"{self.seller.username} - {self.pet.name} - {self.status}"
 
@@ -117,6 +292,15 @@ class BuyerRequest(models.Model):
         ('Rejected', 'Rejected'),
     ], default='Pending')
 
+    objects = RequestQuerySet.as_manager()
+    LIST_USERS = ('buyer',)
+
+    class Meta:
+        # Work queue pages, newest first within a status (see pets/queues.py)
+        indexes = [
+            models.Index(fields=['status', '-created_at', '-id'], name='buyerreq_status_created_idx'),
+        ]
+
     def _str_(self):
         return f"{self.buyer.username} - {self.pet.name} - {self.status}"
 
@@ -133,10 +317,37 @@ class DoctorClearanceRequest(models.Model):
     ], default='Pending')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = RequestQuerySet.as_manager()
+    LIST_USERS = ('requested_by', 'doctor')
+
+    class Meta:
+        # Work queue pages, newest first within a status (see pets/queues.py)
+        indexes = [
+            models.Index(fields=['status', '-created_at', '-id'], name='clearance_status_created_idx'),
+            # A doctor's assigned work (see pets/scheduling.py)
+            models.Index(fields=['doctor', 'status', '-created_at', '-id'], name='clearance_doctor_status_idx'),
+        ]
+
     def _str_(self):
         return f"{self.pet.name} - {self.requested_by.username} - {self.status}"
 
 
+# RequestStatusCount model - rows per status in each request queue, kept current by pets/queues.py
+class RequestStatusCount(models.Model):
+    queue = models.CharField(max_length=20)
+    status = models.CharField(max_length=20)
+    count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['queue', 'status'], name='requeststatuscount_uniq'),
+        ]
+
+    def _str_(self):
+        return f"{self.queue} {self.status}: {self.count}"
+
+
 # Contact model
 class Contact(models.Model):
     name = models.CharField(max_length=255)
@@ -149,13 +360,15 @@ class Contact(models.Model):
     
 from django.db import models
 
-class Product(models.Model):
+class Product(ImageRenditionsMixin, models.Model):
     STATUS_CHOICES = [
         ('in_stock', 'In Stock'),
         ('sold', 'Sold'),
     ]
     name = models.CharField(max_length=255)
-    image = models.ImageField(upload_to='products/')
+    image = models.ImageField(upload_to='products/', storage=content_addressed_storage)
+    image_renditions = models.JSONField(default=dict, blank=True, editable=False)
+    image_placeholder = models.TextField(blank=True, editable=False)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     discount_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='in_stock')
@@ -0,0 +1,37 @@
+"""
+Bulk moderation of submitted pets.
+
+Approval is a single UPDATE over the selected ids.  Rejection deletes in
+batches so each cascade stays a bounded set of ``IN (...)`` statements,
+and adjusts the request counters once for the whole cascade.
+Both only touch pets that are still pending, so a stale selection cannot
+undo an earlier decision, and both report how many pets actually changed.
+"""
+from django.db import transaction
+
+from .caching import invalidate_latest_pets
+from .models import Pet
+from .queues import deleting_pets
+
+REJECT_BATCH_SIZE = 100
+
+
+def approve_pets(pet_ids):
+    with transaction.atomic():
+        approved = Pet.objects.filter(id__in=pet_ids, is_approved=False).update(is_approved=True)
+        if approved:
+            transaction.on_commit(invalidate_latest_pets)
+    return approved
+
+
+def reject_pets(pet_ids):
+    pet_ids = list(pet_ids)
+    rejected = 0
+    with transaction.atomic(), deleting_pets(Pet.objects.filter(id__in=pet_ids, is_approved=False)):
+        for start in range(0, len(pet_ids), REJECT_BATCH_SIZE):
+            batch = pet_ids[start:start + REJECT_BATCH_SIZE]
+            _, deleted = Pet.objects.filter(id__in=batch, is_approved=False).delete()
+            rejected += deleted.get(Pet._meta.label, 0)
+        if rejected:
+            transaction.on_commit(invalidate_latest_pets)
+    return rejected
@@ -0,0 +1,39 @@
+"""
+List querysets for the pets app.
+
+Every list page goes through ``for_list()`` so that the related objects a
+row template touches are joined up front (a fixed query count whatever the
+page size) and only the columns those templates render are loaded.  Keep
+the field lists in step with the list templates.
+"""
+from django.db import models
+
+
+class ProfileQuerySet(models.QuerySet):
+    def for_list(self):
+        return self.select_related('user')
+
+
+class PetQuerySet(models.QuerySet):
+    # Everything the catalog, moderation and dashboard rows render (the
+    # dhash columns flag duplicates in moderation); notably not the
+    # description TextField.
+    LIST_FIELDS = (
+        'id', 'name', 'pet_type', 'breed', 'age', 'gender', 'image', 'image_renditions', 'image_placeholder',
+        'dhash', 'dhash_band0', 'dhash_band1', 'dhash_band2', 'dhash_band3',
+        'is_approved', 'is_adopted', 'owner__id', 'owner__username',
+    )
+
+    def for_list(self):
+        return self.select_related('owner').only(*self.LIST_FIELDS)
+
+
+class RequestQuerySet(models.QuerySet):
+    """Shared by the request workflows; each model names its user FKs in ``LIST_USERS``."""
+
+    def for_list(self):
+        users = self.model.LIST_USERS
+        fields = ['id', 'status', 'created_at', 'pet__id', 'pet__name']
+        for name in users:
+            fields += [f'{name}__id', f'{name}__username']
+        return self.select_related('pet', *users).only(*fields)
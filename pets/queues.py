@@ -0,0 +1,264 @@
+"""
+Work queues over the four request workflows.
+
+Adoption, seller, buyer and doctor-clearance requests each move through
+Pending -> Approved / Rejected.  Queue pages list one status at a time,
+newest first, as keyset-paginated range scans of each model's
+(status, -created_at, -id) index.
+
+Decisions go through ``transition``: one conditional UPDATE of the
+status column alone, matching only rows still in the expected status, for
+one request or any number of them.  Two people deciding the same request
+at once cannot both win, and the caller learns how many rows changed.
+
+Dashboards need per-status totals without counting the tables, so
+``RequestStatusCount`` keeps one row per (queue, status).  The receivers
+below adjust it with a single UPDATE whenever a request is created or
+changes status.  They read the stored status right before each save rather
+than trusting the loaded instance, which may predate a ``transition()`` or
+a ``refresh_from_db()``.  ``update()`` calls that bypass save() must call
+``adjust`` themselves.
+
+Requests are only ever deleted by cascade from their pet or a user, so
+deletes are counted there rather than per request row.  That also keeps
+the request tables free of delete receivers, which lets Django's
+collector delete them with one ``DELETE ... WHERE pet_id IN (...)``
+instead of loading every row first.  Code deleting pets wraps it in
+``deleting_pets``: one grouped query counts the whole cascade up front and
+one UPDATE subtracts it afterwards.  The Pet and User receivers cover
+deletes made any other way (e.g. the admin), one pet or user at a time.
+``manage.py rebuild_request_counts`` recounts everything from the tables.
+"""
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import reduce
+from operator import or_
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import CASCADE, BigIntegerField, Case, CharField, Count, F, IntegerField, Q, Value, When
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .caching import invalidate_doctor_clearances
+from .catalog import timestamp_keyset_page
+from .models import AdoptionRequest, BuyerRequest, DoctorClearanceRequest, Pet, RequestStatusCount, SellerRequest
+
+PENDING = 'Pending'
+STATUSES = ('Pending', 'Approved', 'Rejected')
+DECISIONS = ('Approved', 'Rejected')
+QUEUE_PAGE_SIZE = 25
+
+QUEUES = {
+    'adoption': AdoptionRequest,
+    'seller': SellerRequest,
+    'buyer': BuyerRequest,
+    'clearance': DoctorClearanceRequest,
+}
+QUEUE_MODELS = tuple(QUEUES.values())
+_QUEUE_NAMES = {model: name for name, model in QUEUES.items()}
+
+# True while deleting_pets() counts the cascade, so the Pet receivers stand aside
+_deleting_pets = ContextVar('deleting_pets', default=False)
+
+
+def queue_name(model):
+    return _QUEUE_NAMES[model]
+
+
+def parse_status(value):
+    return value if value in STATUSES else PENDING
+
+
+def queue_page(model, status=PENDING, after=None, size=QUEUE_PAGE_SIZE):
+    """One page of ``model``'s requests in ``status``, newest first.
+
+    ``after`` is a parsed ``catalog.timestamp_cursor``.
+    """
+    return timestamp_keyset_page(model.objects.filter(status=status).for_list(), 'created_at', after=after, size=size)
+
+
+def transition(model, request_ids, status, from_status=PENDING, **filters):
+    """Move the given requests from ``from_status`` to ``status`` in one UPDATE.
+
+    Rows already moved on, or not matching ``filters`` (e.g. the user
+    allowed to decide them), are left alone.  Returns how many changed.
+    """
+    if status not in STATUSES:
+        raise ValueError(f"Unknown request status {status!r}")
+    if status == from_status:
+        return 0
+    requests = model.objects.filter(id__in=list(request_ids), status=from_status, **filters)
+    with transaction.atomic():
+        doctor_ids = (
+            set(requests.exclude(doctor=None).values_list('doctor_id', flat=True).distinct())
+            if model is DoctorClearanceRequest else set()
+        )
+        changed = requests.update(status=status)
+        if changed:
+            queue = queue_name(model)
+            adjust(queue, from_status, -changed)
+            adjust(queue, status, changed)
+            for doctor_id in doctor_ids:
+                transaction.on_commit(lambda doctor_id=doctor_id: invalidate_doctor_clearances(doctor_id))
+    return changed
+
+
+def _user_fields(model):
+    return [field.name for field in model._meta.concrete_fields
+            if field.related_model is User and field.remote_field.on_delete is CASCADE]
+
+
+def pet_requests(pets):
+    """{queue: Q} of the requests that deleting ``pets`` (ids or a queryset) cascades to."""
+    return {name: Q(pet__in=pets) for name in QUEUES}
+
+
+def user_requests(user):
+    """{queue: Q} of the requests deleting ``user`` cascades to directly, not through their pets."""
+    own_pets = reduce(or_, (Q(**{f'pet__{name}': user}) for name in _user_fields(Pet)))
+    return {
+        name: reduce(or_, (Q(**{field: user}) for field in _user_fields(model))) & ~own_pets
+        for name, model in QUEUES.items()
+    }
+
+
+def cascaded(lookups):
+    """Count the requests matching ``lookups`` ({queue: Q}) in one query.
+
+    Returns ({(queue, status): count}, ids of the doctors assigned any of them).
+    """
+    parts = [
+        QUEUES[name].objects.filter(lookup).order_by().values_list(
+            Value(name, output_field=CharField()), F('status'),
+            F('doctor_id') if QUEUES[name] is DoctorClearanceRequest else Value(None, output_field=BigIntegerField()),
+        ).annotate(count=Count('id'))
+        for name, lookup in lookups.items()
+    ]
+    counts, doctor_ids = Counter(), set()
+    for queue, status, doctor_id, count in parts[0].union(*parts[1:], all=True):
+        counts[queue, status] += count
+        if doctor_id is not None:
+            doctor_ids.add(doctor_id)
+    return counts, doctor_ids
+
+
+def uncount(counts, doctor_ids):
+    """Subtract a ``cascaded`` result once its requests are gone."""
+    adjust_many({key: -count for key, count in counts.items()})
+    for doctor_id in doctor_ids:
+        transaction.on_commit(lambda doctor_id=doctor_id: invalidate_doctor_clearances(doctor_id))
+
+
+@contextmanager
+def deleting_pets(pets):
+    """Wrap the deletion of ``pets``, a queryset of exactly the pets the block deletes.
+
+    However many pets and requests go, the counters cost one query before
+    the block and one UPDATE after it.
+    """
+    with transaction.atomic(savepoint=False):
+        cascade = cascaded(pet_requests(pets))
+        token = _deleting_pets.set(True)
+        try:
+            yield
+        finally:
+            _deleting_pets.reset(token)
+        uncount(*cascade)
+
+
+def adjust(queue, status, delta):
+    if not delta:
+        return
+    counter = RequestStatusCount.objects.filter(queue=queue, status=status)
+    if not counter.update(count=F('count') + delta):
+        # Every (queue, status) row exists from migration 0057 on; this only covers a new status
+        RequestStatusCount.objects.bulk_create([RequestStatusCount(queue=queue, status=status)], ignore_conflicts=True)
+        counter.update(count=F('count') + delta)
+
+
+def adjust_many(deltas):
+    """Apply {(queue, status): delta} to the counters in one UPDATE."""
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    rows = reduce(or_, (Q(queue=queue, status=status) for queue, status in deltas))
+    by_row = Case(
+        *(When(queue=queue, status=status, then=Value(delta)) for (queue, status), delta in deltas.items()),
+        output_field=IntegerField(),
+    )
+    if RequestStatusCount.objects.filter(rows).update(count=F('count') + by_row) < len(deltas):
+        existing = set(RequestStatusCount.objects.filter(rows).values_list('queue', 'status'))
+        for (queue, status), delta in deltas.items():
+            if (queue, status) not in existing:
+                adjust(queue, status, delta)
+
+
+def status_counts():
+    """{queue: {status: count}} for every queue, from the counter table in one query."""
+    counts = {name: dict.fromkeys(STATUSES, 0) for name in QUEUES}
+    for queue, status, count in RequestStatusCount.objects.values_list('queue', 'status', 'count'):
+        if queue in counts:
+            counts[queue][status] = count
+    return counts
+
+
+def rebuild_status_counts():
+    """Recount every queue from its table. Returns the total number of requests."""
+    total = 0
+    for name, model in QUEUES.items():
+        counts = dict(model.objects.values_list('status').annotate(count=Count('id')).order_by())
+        for status in set(STATUSES) | set(counts):
+            RequestStatusCount.objects.update_or_create(
+                queue=name, status=status, defaults={'count': counts.get(status, 0)},
+            )
+        total += sum(counts.values())
+    return total
+
+
+@receiver(pre_save, sender=AdoptionRequest)
+@receiver(pre_save, sender=SellerRequest)
+@receiver(pre_save, sender=BuyerRequest)
+@receiver(pre_save, sender=DoctorClearanceRequest)
+def load_status(sender, instance, raw=False, update_fields=None, **kwargs):
+    # The stored status, not the one the instance was loaded with
+    instance._queue_status = None
+    if raw or instance._state.adding or (update_fields is not None and 'status' not in update_fields):
+        return
+    instance._queue_status = sender.objects.filter(pk=instance.pk).values_list('status', flat=True).first()
+
+
+@receiver(post_save, sender=AdoptionRequest)
+@receiver(post_save, sender=SellerRequest)
+@receiver(post_save, sender=BuyerRequest)
+@receiver(post_save, sender=DoctorClearanceRequest)
+def count_status_change(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and 'status' not in update_fields):
+        return
+    queue = queue_name(sender)
+    old = None if created else instance._queue_status
+    if old != instance.status:
+        if old is not None:
+            adjust(queue, old, -1)
+        adjust(queue, instance.status, 1)
+
+
+@receiver(pre_delete, sender=Pet)
+def count_pet_cascade(sender, instance, **kwargs):
+    if not _deleting_pets.get():
+        instance._queue_cascade = cascaded(pet_requests([instance.pk]))
+
+
+@receiver(pre_delete, sender=User)
+def count_user_cascade(sender, instance, **kwargs):
+    # Requests on the user's own pets are counted by count_pet_cascade
+    instance._queue_cascade = cascaded(user_requests(instance))
+
+
+@receiver(post_delete, sender=Pet)
+@receiver(post_delete, sender=User)
+def uncount_cascade(sender, instance, **kwargs):
+    cascade = instance.__dict__.pop('_queue_cascade', None)
+    if cascade is not None:
+        uncount(*cascade)
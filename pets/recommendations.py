@@ -0,0 +1,122 @@
+"""
+Precomputed "similar pets" recommendations.
+
+``build_similar_pets`` scores every approved pet against every available
+one with NumPy and stores the top-k neighbours per pet in ``SimilarPet``,
+so ``pet_detail`` reads its recommendations with one indexed query.  Only
+pets of the same type are ever recommended; among those, a shared breed
+weighs most, then closeness in age, then gender.  Scores are computed a
+block of rows at a time to bound memory on large catalogs.
+
+Rebuild with ``manage.py build_similar_pets`` (e.g. nightly).
+"""
+import numpy as np
+from django.db import transaction
+
+from .models import Pet, SimilarPet
+
+TOP_K = 6
+BLOCK_SIZE = 256
+BATCH_SIZE = 1000
+
+BREED_WEIGHT = 3.0
+AGE_WEIGHT = 2.0
+GENDER_WEIGHT = 1.0
+AGE_SCALE = 3.0  # age difference at which the age score has decayed to ~37%
+
+
+def _codes(values):
+    """Encode a list of strings as integer category codes (case-insensitive)."""
+    _, codes = np.unique([(value or '').strip().lower() for value in values], return_inverse=True)
+    return codes
+
+
+def similarity_scores(features, rows, columns):
+    """Score the pets at ``rows`` against those at ``columns``; -inf marks pets never to recommend."""
+    pet_type, breed, gender, age = features
+    same_type = pet_type[rows, None] == pet_type[None, columns]
+    scores = (
+        BREED_WEIGHT * (breed[rows, None] == breed[None, columns])
+        + GENDER_WEIGHT * (gender[rows, None] == gender[None, columns])
+        + AGE_WEIGHT * np.exp(-np.abs(age[rows, None] - age[None, columns]) / AGE_SCALE)
+    ).astype(np.float32)
+    scores[~same_type] = -np.inf
+    return scores
+
+
+def top_k_similar(ids, features, available, k=TOP_K, block_size=BLOCK_SIZE):
+    """Yield (pet_id, [(similar_id, score), ...]) for every pet, best match first."""
+    columns = np.flatnonzero(available)
+    if not len(columns):
+        return
+    k = min(k, len(columns))
+    for start in range(0, len(ids), block_size):
+        rows = np.arange(start, min(start + block_size, len(ids)))
+        scores = similarity_scores(features, rows, columns)
+        # A pet is never similar to itself
+        scores[rows[:, None] == columns[None, :]] = -np.inf
+
+        best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(scores, best, axis=1)
+        order = np.argsort(-best_scores, axis=1)
+        best = np.take_along_axis(best, order, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+
+        for row, neighbours, neighbour_scores in zip(rows, best, best_scores):
+            yield ids[row], [
+                (ids[columns[column]], float(score))
+                for column, score in zip(neighbours, neighbour_scores)
+                if np.isfinite(score)
+            ]
+
+
+def build_similar_pets(k=TOP_K, block_size=BLOCK_SIZE):
+    """Recompute the SimilarPet table for all approved pets. Returns the number of rows written."""
+    pets = list(
+        Pet.objects.filter(is_approved=True)
+        .order_by('id')
+        .values_list('id', 'pet_type', 'breed', 'gender', 'age', 'is_adopted')
+    )
+    if not pets:
+        SimilarPet.objects.all().delete()
+        return 0
+
+    ids, pet_types, breeds, genders, ages, adopted = zip(*pets)
+    ids = np.array(ids)
+    features = (
+        _codes(pet_types),
+        _codes(breeds),
+        _codes(genders),
+        np.array(ages, dtype=np.float32),
+    )
+    available = ~np.array(adopted, dtype=bool)
+
+    written = 0
+    with transaction.atomic():
+        SimilarPet.objects.all().delete()
+        batch = []
+        for pet_id, neighbours in top_k_similar(ids, features, available, k, block_size):
+            batch.extend(
+                SimilarPet(pet_id=int(pet_id), similar_id=int(similar_id), rank=rank, score=score)
+                for rank, (similar_id, score) in enumerate(neighbours)
+            )
+            if len(batch) >= BATCH_SIZE:
+                SimilarPet.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+        SimilarPet.objects.bulk_create(batch)
+        written += len(batch)
+    return written
+
+
+def similar_pets(pet, limit=TOP_K):
+    """Still-available recommendations for ``pet`` from the precomputed table."""
+    return [
+        row.similar
+        for row in SimilarPet.objects.filter(
+            pet=pet, similar__is_approved=True, similar__is_adopted=False,
+        ).select_related('similar').only(
+            'rank', 'similar__id', 'similar__name', 'similar__breed', 'similar__age', 'similar__image',
+            'similar__image_renditions', 'similar__image_placeholder',
+        ).order_by('rank')[:limit]
+    ]
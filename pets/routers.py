@@ -0,0 +1,33 @@
+"""
+Database routing for the shared cache.
+
+settings.CACHES uses Django's DatabaseCache so the web, image worker and
+clearance scheduler processes all see the same entries.  Its table lives in
+the separate ``cache`` database rather than next to the app tables: cache
+reads and writes then never wait on the app database's write lock, and the
+query budgets (pets/budgets.py) keep counting only application SQL.
+"""
+
+CACHE_DATABASE = 'cache'
+CACHE_APP_LABEL = 'django_cache'
+
+
+class CacheRouter:
+    """Send DatabaseCache's table to ``CACHE_DATABASE`` and nothing else there."""
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == CACHE_APP_LABEL:
+            return CACHE_DATABASE
+        return None
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label == CACHE_APP_LABEL:
+            return CACHE_DATABASE
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if app_label == CACHE_APP_LABEL:
+            return db == CACHE_DATABASE
+        if db == CACHE_DATABASE:
+            return False
+        return None
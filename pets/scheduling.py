@@ -0,0 +1,192 @@
+"""
+Assigning doctor clearance requests to doctors.
+
+Every pending, unassigned ``DoctorClearanceRequest`` goes to an active
+doctor (``Profile.role='doctor'``, ``status='active'``): the one with the
+fewest open (pending) clearances, preferring doctors whose
+``Profile.specialization`` names the pet's type unless they already carry
+``SPECIALIST_SLACK`` more open clearances than the least-loaded doctor.
+
+The assignment itself is a conditional UPDATE that only matches while
+the request is still pending and unassigned, so any number of scheduler
+processes (and the view that assigns a new request straight away) can run
+side by side: a request is claimed exactly once, and a worker that loses
+the race moves on.  A worker plans a whole batch in memory, counting its
+own choices into the loads it read at the start of the round so the
+batch spreads across doctors, then claims it with one UPDATE.
+
+Each doctor's dashboard reads its per-status counts from a small cache
+(``caching.doctor_clearance_counts``).  Claims, releases and the receivers
+below invalidate it whenever a request is assigned to or taken from a
+doctor or changes status; ``queues.uncount`` does so when requests are
+deleted.  The scheduler runs in its own process, so this relies on the
+shared cache in settings.CACHES (``checks`` warns about a process-local
+one).
+"""
+import re
+
+from django.db import transaction
+from django.db.models import Case, Count, IntegerField, Value, When
+from django.db.models.signals import post_init, post_save
+from django.dispatch import receiver
+
+from .caching import invalidate_doctor_clearances
+from .catalog import timestamp_keyset_page
+from .models import DoctorClearanceRequest, Profile
+from .queues import PENDING, QUEUE_PAGE_SIZE
+
+# Everything a row on the doctor dashboard renders
+ASSIGNED_FIELDS = (
+    'id', 'status', 'created_at', 'doctor',
+    'pet__id', 'pet__name', 'pet__pet_type', 'pet__breed', 'pet__age', 'pet__gender',
+    'requested_by__id', 'requested_by__username', 'requested_by__email',
+)
+
+ASSIGN_BATCH_SIZE = 100
+SPECIALIST_SLACK = 3
+
+
+def active_doctors():
+    """{doctor user id: lower-cased specialization} for every doctor who can take requests."""
+    profiles = Profile.objects.filter(role='doctor', status='active', user__is_active=True)
+    return {user_id: (specialization or '').lower() for user_id, specialization in
+            profiles.values_list('user_id', 'specialization')}
+
+
+def open_loads(doctor_ids):
+    """{doctor user id: pending clearances assigned to them}, in one grouped query."""
+    loads = dict.fromkeys(doctor_ids, 0)
+    rows = (
+        DoctorClearanceRequest.objects.filter(status=PENDING, doctor_id__in=list(doctor_ids))
+        .values_list('doctor_id').annotate(count=Count('id')).order_by()
+    )
+    loads.update(rows)
+    return loads
+
+
+def specializes_in(specialization, pet_type):
+    # Whole words only: 'Cat' matches 'cats' and 'Dog & cat surgery', not 'vacation cover'
+    if not pet_type:
+        return False
+    return re.search(rf'\b{re.escape(pet_type.lower())}(?:e?s)?\b', specialization) is not None
+
+
+def choose_doctor(pet_type, doctors, loads):
+    """The doctor id to give a ``pet_type`` request to, or None when there are no doctors."""
+    if not doctors:
+        return None
+    least_loaded = min(doctors, key=lambda doctor_id: (loads[doctor_id], doctor_id))
+    specialists = [doctor_id for doctor_id, specialization in doctors.items()
+                   if specializes_in(specialization, pet_type)]
+    if specialists:
+        specialist = min(specialists, key=lambda doctor_id: (loads[doctor_id], doctor_id))
+        if loads[specialist] - loads[least_loaded] <= SPECIALIST_SLACK:
+            return specialist
+    return least_loaded
+
+
+def claim(request_id, doctor_id):
+    """Assign the request if it is still pending and unassigned. Returns whether this call won."""
+    won = bool(
+        DoctorClearanceRequest.objects.filter(id=request_id, status=PENDING, doctor__isnull=True)
+        .update(doctor_id=doctor_id)
+    )
+    if won:
+        transaction.on_commit(lambda: invalidate_doctor_clearances(doctor_id))
+    return won
+
+
+def claim_many(assignments):
+    """Claim {request id: doctor id} in one UPDATE, skipping requests taken meanwhile.
+
+    Returns the assignments this call won.
+    """
+    if not assignments:
+        return {}
+    doctor_for = Case(
+        *(When(id=request_id, then=Value(doctor_id)) for request_id, doctor_id in assignments.items()),
+        output_field=IntegerField(),
+    )
+    claimed = (
+        DoctorClearanceRequest.objects.filter(id__in=list(assignments), status=PENDING, doctor__isnull=True)
+        .update(doctor_id=doctor_for)
+    )
+    if claimed == len(assignments):
+        won = assignments
+    elif not claimed:
+        won = {}
+    else:
+        # Another worker got some of them first; keep the ones that carry our choice
+        rows = DoctorClearanceRequest.objects.filter(id__in=list(assignments)).values_list('id', 'doctor_id')
+        won = {request_id: doctor_id for request_id, doctor_id in rows if assignments[request_id] == doctor_id}
+    for doctor_id in set(won.values()):
+        transaction.on_commit(lambda doctor_id=doctor_id: invalidate_doctor_clearances(doctor_id))
+    return won
+
+
+def release_unavailable():
+    """Unassign pending requests held by doctors who are no longer active. Returns how many."""
+    available = Profile.objects.filter(role='doctor', status='active', user__is_active=True).values('user_id')
+    held = DoctorClearanceRequest.objects.filter(status=PENDING, doctor__isnull=False).exclude(doctor_id__in=available)
+    doctor_ids = set(held.values_list('doctor_id', flat=True).distinct())
+    released = held.update(doctor=None) if doctor_ids else 0
+    for doctor_id in doctor_ids:
+        invalidate_doctor_clearances(doctor_id)
+    return released
+
+
+def assign(clearance):
+    """Assign one new request straight away. Returns the doctor id, or None if none was free."""
+    doctors = active_doctors()
+    doctor_id = choose_doctor(clearance.pet.pet_type, doctors, open_loads(doctors))
+    if doctor_id is not None and claim(clearance.id, doctor_id):
+        clearance.doctor_id = doctor_id
+        return doctor_id
+    return None
+
+
+def assign_pending(batch_size=ASSIGN_BATCH_SIZE):
+    """Assign up to ``batch_size`` waiting requests, oldest first. Returns how many this call claimed."""
+    doctors = active_doctors()
+    if not doctors:
+        return 0
+    waiting = list(
+        DoctorClearanceRequest.objects.filter(status=PENDING, doctor__isnull=True)
+        .order_by('created_at', 'id').values_list('id', 'pet__pet_type')[:batch_size]
+    )
+    if not waiting:
+        return 0
+
+    loads = open_loads(doctors)
+    assignments = {}
+    for request_id, pet_type in waiting:
+        doctor_id = choose_doctor(pet_type, doctors, loads)
+        assignments[request_id] = doctor_id
+        loads[doctor_id] += 1
+    return len(claim_many(assignments))
+
+
+def assigned_page(doctor, status=PENDING, after=None, size=QUEUE_PAGE_SIZE):
+    """One page of the clearance requests assigned to ``doctor`` in ``status``, newest first.
+
+    A single query joining the pet and the requester.  ``after`` is a parsed
+    ``catalog.timestamp_cursor``.
+    """
+    assigned = (
+        DoctorClearanceRequest.objects.filter(doctor=doctor, status=status)
+        .select_related('pet', 'requested_by').only(*ASSIGNED_FIELDS)
+    )
+    return timestamp_keyset_page(assigned, 'created_at', after=after, size=size)
+
+
+@receiver(post_init, sender=DoctorClearanceRequest)
+def remember_doctor(sender, instance, **kwargs):
+    instance._assigned_doctor_id = None if 'doctor' in instance.get_deferred_fields() else instance.doctor_id
+
+
+@receiver(post_save, sender=DoctorClearanceRequest)
+def invalidate_assigned_counts(sender, instance, **kwargs):
+    doctor_ids = {getattr(instance, '_assigned_doctor_id', None), instance.doctor_id}
+    for doctor_id in doctor_ids:
+        invalidate_doctor_clearances(doctor_id)
+    instance._assigned_doctor_id = instance.doctor_id
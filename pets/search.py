@@ -0,0 +1,125 @@
+"""
+Full-text search over Pet name, breed and description.
+
+SQLite keeps a separate FTS5 table (``pets_pet_fts``, rowid = pet id)
+that is refreshed from the Pet post_save/post_delete signals below.
+PostgreSQL searches a GIN expression index over a weighted tsvector, which
+the database keeps current by itself.  Other backends fall back to
+``icontains`` lookups.  Both indexes are created by migration 0043; run
+``manage.py rebuild_search_index`` after bulk imports that skip signals.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Pet
+
+FTS_TABLE = 'pets_pet_fts'
+
+# name matches weigh more than breed, breed more than description
+FTS_RANK = f'bm25({FTS_TABLE}, 10.0, 5.0, 1.0)'
+
+PG_VECTOR = (
+    "(setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(breed, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'C'))"
+)
+
+MAX_RESULTS = 50
+
+
+def _terms(query):
+    return re.findall(r'\w+', query.lower())
+
+
+def _fts_query(terms):
+    # Quote every term so user input can never be parsed as FTS5 syntax,
+    # and allow prefix matches for type-ahead style queries.
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def _ranked_ids(terms, queryset, limit):
+    candidates_sql, candidates_params = queryset.values('id').query.sql_with_params()
+    if connection.vendor == 'sqlite':
+        sql = (
+            f'SELECT rowid FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid IN ({candidates_sql}) '
+            f'ORDER BY {FTS_RANK} LIMIT %s'
+        )
+        params = [_fts_query(terms), *candidates_params, limit]
+    else:
+        tsquery = "to_tsquery('english', %s)"
+        sql = (
+            f'SELECT id FROM pets_pet '
+            f'WHERE {PG_VECTOR} @@ {tsquery} AND id IN ({candidates_sql}) '
+            f'ORDER BY ts_rank({PG_VECTOR}, {tsquery}) DESC, id DESC LIMIT %s'
+        )
+        pg_query = ' & '.join(f'{term}:*' for term in terms)
+        params = [pg_query, *candidates_params, pg_query, limit]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_pets(query, queryset=None, limit=MAX_RESULTS):
+    """Return up to ``limit`` pets from ``queryset`` matching ``query``, best match first."""
+    if queryset is None:
+        queryset = Pet.objects.all()
+    terms = _terms(query)
+    if not terms:
+        return []
+
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        condition = Q()
+        for term in terms:
+            condition &= Q(name__icontains=term) | Q(breed__icontains=term) | Q(description__icontains=term)
+        return list(queryset.filter(condition).order_by('-id')[:limit])
+
+    ids = _ranked_ids(terms, queryset, limit)
+    pets = queryset.in_bulk(ids)
+    return [pets[pet_id] for pet_id in ids if pet_id in pets]
+
+
+def index_pet(pet):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [pet.pk])
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, breed, description) VALUES (%s, %s, %s, %s)',
+            [pet.pk, pet.name, pet.breed, pet.description],
+        )
+
+
+def unindex_pet(pet_id):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [pet_id])
+
+
+def rebuild_index():
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, breed, description) '
+            f'SELECT id, name, breed, description FROM pets_pet'
+        )
+
+
+@receiver(post_save, sender=Pet)
+def sync_pet_search_index(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not {'name', 'breed', 'description'} & set(update_fields):
+        return
+    index_pet(instance)
+
+
+@receiver(post_delete, sender=Pet)
+def remove_pet_from_search_index(sender, instance, **kwargs):
+    unindex_pet(instance.pk)
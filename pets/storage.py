@@ -0,0 +1,64 @@
+"""
+Content-addressed storage for Pet and Product images.
+
+Files are named after the SHA-256 of their bytes and sharded by hash
+prefix, e.g. ``cas/3f/a2/3fa2...e1.jpg``, so the same upload is stored
+once however many listings use it, and a name never changes meaning
+(safe to cache forever).  Saving bytes that are already stored is a
+no-op that returns the existing name.  Reference counts and deletion live
+in pets/blobs.py; this class never deletes anything on its own.
+"""
+import hashlib
+import posixpath
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+CAS_DIR = 'cas'
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks(HASH_CHUNK_SIZE):
+        digest.update(chunk if isinstance(chunk, bytes) else chunk.encode())
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return digest.hexdigest()
+
+
+def hashed_name(name, digest):
+    extension = posixpath.splitext(name)[1].lower()
+    return posixpath.join(CAS_DIR, digest[:2], digest[2:4], f'{digest}{extension}')
+
+
+def is_hashed_name(name):
+    return bool(name) and name.startswith(CAS_DIR + '/')
+
+
+@deconstructible(path='pets.storage.ContentAddressedStorage')
+class ContentAddressedStorage(FileSystemStorage):
+    def __init__(self, **kwargs):
+        # Two uploads racing on the same hash write identical bytes, so
+        # letting the second overwrite is harmless and avoids a renamed copy.
+        kwargs.setdefault('allow_overwrite', True)
+        super().__init__(**kwargs)
+
+    def get_available_name(self, name, max_length=None):
+        # The real name is only known once the content is hashed in _save()
+        return name
+
+    def hashed_name_for(self, content, name=None):
+        """The name ``content`` is (or would be) stored under."""
+        return hashed_name(name or content.name, content_hash(content))
+
+    def _save(self, name, content):
+        name = self.hashed_name_for(content, name)
+        if self.exists(name):
+            return name
+        return super()._save(name, content)
+
+
+content_addressed_storage = ContentAddressedStorage()
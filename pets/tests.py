@@ -0,0 +1,420 @@
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+
+from pets import archive, blobs, catalog, chat, queues
+from pets.facets import compute_facets
+from pets.budgets import BUDGETS
+from pets.management.commands.check_query_budgets import login_clients, named_routes, replay, seed
+from pets.media import parse_range
+from pets.models import BuyerRequest, Conversation, MediaBlob, Message, Pet, Profile, SellerRequest
+from pets.storage import content_addressed_storage
+
+
+def make_user(username, role='user'):
+    user = User.objects.create_user(username, f'{username}@example.com', 'test-password')
+    Profile.objects.create(user=user, role=role)
+    return user
+
+
+class RouteBudgetTests(SimpleTestCase):
+
+    def test_every_route_has_a_budget(self):
+        for pattern in named_routes():
+            with self.subTest(route=pattern.name):
+                self.assertIn(pattern.name, BUDGETS, "register a Budget in pets/budgets.py")
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class QueryBudgetTests(TransactionTestCase):
+    """Every pets route, replayed against the check_query_budgets dataset, stays within its budget.
+
+    Not a TestCase: wrapping the cache database in a transaction would turn each
+    cache write's BEGIN into a savepoint and its release, and miscount the views.
+    """
+
+    databases = {'default', 'cache'}
+
+    def setUp(self):
+        cache.clear()
+        self.fixtures = seed(pet_count=300, message_count=200)
+
+    def test_routes_stay_within_their_query_budgets(self):
+        clients = login_clients(self.fixtures['users'])
+        for pattern in named_routes():
+            if pattern.name not in BUDGETS:
+                continue
+            with self.subTest(route=pattern.name):
+                url, response, recorder = replay(self.fixtures, clients, pattern)
+                self.assertLess(response.status_code, 500, url)
+                self.assertLessEqual(
+                    recorder.count, BUDGETS[pattern.name].max_queries,
+                    f"{url} ran {recorder.count} queries; raise its Budget only if the view needs them",
+                )
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class RequestDecisionTests(TestCase):
+    databases = {'default', 'cache'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = make_user('seller')
+        cls.buyer = make_user('buyer')
+        cls.doctor = make_user('doctor', role='doctor')
+        cls.admin = make_user('admin', role='admin')
+        cls.pet = Pet.objects.create(name='Rex', pet_type='Dog', age=3, owner=cls.seller, seller=cls.seller)
+
+    def counts(self, queue):
+        return queues.status_counts()[queue]
+
+    def test_transition_returns_rows_changed(self):
+        requests = [BuyerRequest.objects.create(buyer=self.buyer, pet=self.pet) for _ in range(3)]
+        queues.transition(BuyerRequest, [requests[0].pk], 'Rejected')
+
+        changed = queues.transition(BuyerRequest, [r.pk for r in requests], 'Approved')
+
+        self.assertEqual(changed, 2)
+        self.assertEqual(self.counts('buyer'), {'Pending': 0, 'Approved': 2, 'Rejected': 1})
+
+    def test_losing_concurrent_decision_changes_nothing(self):
+        request = BuyerRequest.objects.create(buyer=self.buyer, pet=self.pet)
+        # Both deciders saw it pending; the first UPDATE wins
+        self.assertEqual(queues.transition(BuyerRequest, [request.pk], 'Approved'), 1)
+        self.assertEqual(queues.transition(BuyerRequest, [request.pk], 'Rejected'), 0)
+
+        request.refresh_from_db()
+        self.assertEqual(request.status, 'Approved')
+        self.assertEqual(self.counts('buyer'), {'Pending': 0, 'Approved': 1, 'Rejected': 0})
+
+    def test_transition_respects_filters(self):
+        request = BuyerRequest.objects.create(buyer=self.buyer, pet=self.pet)
+        self.assertEqual(queues.transition(BuyerRequest, [request.pk], 'Approved', pet__seller=self.buyer), 0)
+        self.assertEqual(queues.transition(BuyerRequest, [request.pk], 'Approved', pet__seller=self.seller), 1)
+
+    def test_seller_request_decision_is_forbidden_to_buyers_and_sellers(self):
+        request = SellerRequest.objects.create(seller=self.seller, pet=self.pet)
+        url = reverse('update_seller_request_status', args=[request.pk, 'Approved'])
+        bulk_url = reverse('bulk_update_requests', args=['seller'])
+        for user in (self.buyer, self.seller):
+            with self.subTest(user=user.username):
+                self.client.force_login(user)
+                self.assertEqual(self.client.post(url).status_code, 403)
+                self.assertEqual(
+                    self.client.post(bulk_url, {'status': 'Approved', 'request_ids': [request.pk]}).status_code, 403,
+                )
+        request.refresh_from_db()
+        self.assertEqual(request.status, 'Pending')
+
+    def test_admins_and_doctors_decide_seller_requests(self):
+        for user, status in ((self.doctor, 'Approved'), (self.admin, 'Rejected')):
+            with self.subTest(user=user.username):
+                request = SellerRequest.objects.create(seller=self.seller, pet=self.pet)
+                self.client.force_login(user)
+                response = self.client.post(reverse('update_seller_request_status', args=[request.pk, status]))
+                self.assertRedirects(response, reverse('seller_requests'), fetch_redirect_response=False)
+                request.refresh_from_db()
+                self.assertEqual(request.status, status)
+
+    def test_buyer_request_decision_needs_post(self):
+        request = BuyerRequest.objects.create(buyer=self.buyer, pet=self.pet)
+        self.client.force_login(self.seller)
+        self.client.get(reverse('update_buyer_request_status', args=[request.pk, 'Approved']))
+        request.refresh_from_db()
+        self.assertEqual(request.status, 'Pending')
+
+
+class KeysetPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = make_user('seller')
+        cls.pets = [Pet.objects.create(name=f'Pet {i}', pet_type='Dog', age=i, seller=cls.seller) for i in range(7)]
+        cls.ids = [pet.id for pet in cls.pets]
+
+    def walk(self, **kwargs):
+        pages, after = [], None
+        while True:
+            page = catalog.keyset_page(Pet.objects.all(), after=after, size=3, **kwargs)
+            pages.append([pet.id for pet in page.items])
+            if not page.has_next:
+                return pages
+            after = page.next_cursor
+
+    def test_pages_cover_every_row_once_newest_first(self):
+        newest_first = self.ids[::-1]
+        self.assertEqual(self.walk(), [newest_first[:3], newest_first[3:6], newest_first[6:]])
+
+    def test_ascending_pages(self):
+        self.assertEqual(self.walk(descending=False), [self.ids[:3], self.ids[3:6], self.ids[6:]])
+
+    def test_before_walks_back_to_the_same_pages(self):
+        first = catalog.keyset_page(Pet.objects.all(), size=3)
+        second = catalog.keyset_page(Pet.objects.all(), after=first.next_cursor, size=3)
+        self.assertFalse(first.has_prev)
+        self.assertEqual(second.prev_cursor, second.items[0].id)
+
+        back = catalog.keyset_page(Pet.objects.all(), before=second.prev_cursor, size=3)
+        self.assertEqual([pet.id for pet in back.items], [pet.id for pet in first.items])
+        self.assertFalse(back.has_prev)
+        self.assertEqual(back.next_cursor, first.items[-1].id)
+
+    def test_timestamp_pages_break_ties_on_id(self):
+        buyer = make_user('buyer')
+        requests = [BuyerRequest.objects.create(buyer=buyer, pet=self.pets[0]) for _ in range(5)]
+        # Two share a timestamp across the page boundary
+        now = timezone.now()
+        for request, minutes in zip(requests, (5, 4, 3, 3, 1)):
+            BuyerRequest.objects.filter(pk=request.pk).update(created_at=now - timedelta(minutes=minutes))
+
+        seen, after = [], None
+        while True:
+            page = catalog.timestamp_keyset_page(BuyerRequest.objects.all(), 'created_at', after=after, size=3)
+            seen.extend(request.id for request in page.items)
+            if not page.has_next:
+                break
+            after = catalog.parse_timestamp_cursor(page.next_cursor)
+        expected = [requests[4].id, requests[3].id, requests[2].id, requests[1].id, requests[0].id]
+        self.assertEqual(seen, expected)
+
+    def test_cursor_parsing(self):
+        for value in (None, '', 'abc', '0', '-4'):
+            with self.subTest(value=value):
+                self.assertIsNone(catalog.parse_cursor(value))
+        self.assertEqual(catalog.parse_cursor('12'), 12)
+
+        moment = timezone.now()
+        self.assertEqual(catalog.parse_timestamp_cursor(catalog.timestamp_cursor(moment, 42)), (moment, 42))
+        for value in (None, '', '12', 'a.b', '1.2.3'):
+            with self.subTest(value=value):
+                self.assertIsNone(catalog.parse_timestamp_cursor(value))
+
+
+class ParseRangeTests(SimpleTestCase):
+
+    def test_ranges(self):
+        cases = {
+            'bytes=0-9': (0, 9),
+            'bytes=90-': (90, 99),
+            'bytes=50-500': (50, 99),
+            'bytes=-10': (90, 99),
+            'bytes=-500': (0, 99),
+            'bytes=100-': False,
+            'bytes=5-2': False,
+            'bytes=-0': False,
+            'bytes=0-1,4-5': None,
+            'bytes=-': None,
+            'items=0-9': None,
+        }
+        for header, expected in cases.items():
+            with self.subTest(header=header):
+                self.assertEqual(parse_range(header, 100), expected)
+
+
+class MediaTestCase(TestCase):
+    # Files written by a test go to a throwaway MEDIA_ROOT
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+class ServeMediaTests(MediaTestCase):
+    databases = {'default', 'cache'}
+
+    def setUp(self):
+        super().setUp()
+        self.body = bytes(range(100))
+        self.name = content_addressed_storage.save('sample.bin', SimpleUploadedFile('sample.bin', self.body))
+        self.url = '/media/' + self.name
+
+    def get(self, **headers):
+        response = self.client.get(self.url, headers=headers)
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, content
+
+    def test_whole_file_is_immutable(self):
+        response, content = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(content, self.body)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+    def test_byte_range(self):
+        response, content = self.get(Range='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(content, self.body[10:20])
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/100')
+        self.assertEqual(response['Content-Length'], '10')
+
+    def test_unsatisfiable_range(self):
+        response, _ = self.get(Range='bytes=100-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */100')
+
+    def test_if_range(self):
+        etag = self.get()[0]['ETag']
+        response, content = self.get(Range='bytes=90-', If_Range=etag)
+        self.assertEqual((response.status_code, content), (206, self.body[90:]))
+
+        response, content = self.get(Range='bytes=90-', If_Range='"stale"')
+        self.assertEqual((response.status_code, content), (200, self.body))
+
+        response, content = self.get(Range='bytes=90-', If_Range=http_date(0))
+        self.assertEqual((response.status_code, content), (200, self.body))
+
+    def test_conditional_get(self):
+        etag = self.get()[0]['ETag']
+        response, _ = self.get(If_None_Match=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_no_session_cookie_for_logged_in_users(self):
+        self.client.force_login(make_user('viewer'))
+        response, _ = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.cookies)
+        self.assertNotIn('Vary', response)
+
+    def test_missing_and_outside_files(self):
+        for url in ('/media/cas/00/00/missing.bin', '/media/../settings.py'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class ArchivePagingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = make_user('seller')
+        cls.buyer = make_user('buyer')
+        pet = Pet.objects.create(name='Rex', pet_type='Dog', age=3, owner=cls.seller, seller=cls.seller)
+        conversation = Conversation.objects.create(pet=pet, buyer=cls.buyer, seller=cls.seller)
+        cls.key = (pet.id, cls.buyer.id, cls.seller.id)
+        cls.ids = [
+            Message.objects.create(
+                pet=pet, sender=cls.buyer if i % 2 else cls.seller, receiver=cls.seller if i % 2 else cls.buyer,
+                content=f'Message {i}', conversation=conversation,
+            ).id
+            for i in range(12)
+        ]
+        # The oldest eight, in segments of three
+        cls.archived = archive.archive_conversation(conversation.id, cls.ids[7], segment_size=3)
+
+    def test_archive_moves_a_prefix(self):
+        self.assertEqual(self.archived, 8)
+        self.assertEqual(list(Message.objects.values_list('id', flat=True).order_by('id')), self.ids[8:])
+        conversation = Conversation.objects.get()
+        self.assertEqual(conversation.archived_through_id, self.ids[7])
+        self.assertEqual(conversation.archives.count(), 3)
+
+    def test_history_pages_run_on_into_the_archive(self):
+        seen, before = [], None
+        while True:
+            page = chat.history_page(self.key, before=before, size=5)
+            seen.extend(message.id for message in page.items)
+            if not page.has_next:
+                break
+            before = page.next_cursor
+        self.assertEqual(seen, self.ids[::-1])
+
+    def test_archived_messages_keep_sender_and_content(self):
+        messages = archive.archived_page(self.key, before=self.ids[5], size=2)
+        self.assertEqual([message.id for message in messages], [self.ids[4], self.ids[3]])
+        self.assertEqual(messages[0].content, 'Message 4')
+        self.assertEqual(messages[0].sender, self.seller)
+        self.assertTrue(messages[0].archived)
+
+
+class MediaBlobRefcountTests(MediaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.seller = make_user('seller')
+
+    def create_pet(self, content):
+        return Pet.objects.create(
+            name='Rex', pet_type='Dog', age=3, seller=self.seller,
+            image=SimpleUploadedFile('photo.jpg', content),
+        )
+
+    def refcounts(self):
+        return dict(MediaBlob.objects.values_list('name', 'refcount'))
+
+    def test_shared_upload_is_counted_per_pet(self):
+        first, second = self.create_pet(b'same bytes'), self.create_pet(b'same bytes')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(self.refcounts(), {first.image.name: 2})
+
+        first.delete()
+        self.assertEqual(self.refcounts(), {second.image.name: 1})
+
+    def test_replacing_an_image_moves_the_reference(self):
+        pet = self.create_pet(b'old bytes')
+        old = pet.image.name
+        pet.image = SimpleUploadedFile('photo.jpg', b'new bytes')
+        pet.save()
+        self.assertEqual(self.refcounts(), {old: 0, pet.image.name: 1})
+
+    def test_saving_a_partially_loaded_pet_keeps_the_counts(self):
+        pet = self.create_pet(b'some bytes')
+        partial = Pet.objects.only('id', 'name').get(pk=pet.pk)
+        partial.name = 'Max'
+        partial.save()
+        self.assertEqual(self.refcounts(), {pet.image.name: 1})
+
+    def test_rebuild_matches_the_receivers(self):
+        kept, dropped = self.create_pet(b'kept'), self.create_pet(b'dropped')
+        dropped.delete()
+        counted = self.refcounts()
+        MediaBlob.objects.update(refcount=7)
+        self.assertEqual(blobs.rebuild_refcounts(), 1)
+        self.assertEqual(self.refcounts(), counted)
+        self.assertEqual(counted[kept.image.name], 1)
+
+    def test_garbage_collection_only_removes_old_unreferenced_files(self):
+        kept, dropped = self.create_pet(b'kept'), self.create_pet(b'dropped')
+        dropped_name = dropped.image.name
+        dropped.delete()
+        self.assertEqual(blobs.collect_garbage(), (0, 0))
+
+        MediaBlob.objects.update(updated_at=timezone.now() - blobs.GC_GRACE - timedelta(minutes=1))
+        self.assertEqual(blobs.collect_garbage(), (1, len(b'dropped')))
+        self.assertFalse(content_addressed_storage.exists(dropped_name))
+        self.assertTrue(content_addressed_storage.exists(kept.image.name))
+        self.assertEqual(self.refcounts(), {kept.image.name: 1})
+
+
+class FacetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seller = make_user('seller')
+        for pet_type, age in (('Dog', 1), ('Dog', 3), ('Dog', 6), ('Cat', 3), ('Cat', 12)):
+            Pet.objects.create(name='Pet', pet_type=pet_type, age=age, seller=seller, is_approved=True)
+
+    def facets(self, filters, query=''):
+        facets = compute_facets(Pet.objects.all(), filters, query)
+        return {facet['value']: facet['count'] for facet in facets['pet_type']}, facets['age']
+
+    def test_age_buckets_ignore_the_age_range(self):
+        types, ages = self.facets({'pet_type': 'Dog', 'age_min': 2, 'age_max': 4})
+        self.assertEqual(types, {'Dog': 1, 'Cat': 1})
+        self.assertEqual([bucket['count'] for bucket in ages], [1, 1, 1, 0])
+
+    def test_age_bucket_links_keep_the_search(self):
+        _, ages = self.facets({'pet_type': 'Dog'}, query='good boy')
+        self.assertEqual(ages[1]['query'], 'pet_type=Dog&age_min=2&age_max=4&q=good+boy')
+        _, ages = self.facets({})
+        self.assertNotIn('q=', ages[3]['query'])
@@ -26,6 +26,8 @@ urlpatterns = [
     path('viewpets/', views.view_pets, name='viewpets'),
     path('chatroom/<int:pet_id>/', views.create_or_redirect_chat, name='create_or_redirect_chat'),
     path('chatroom/<int:pet_id>/<int:other_user_id>/', views.chatroom, name='chatroom'),
+    path('chatroom/<int:pet_id>/<int:other_user_id>/messages/', views.chat_messages, name='chat_messages'),
+    path('chats/unread/', views.unread_messages, name='unread_messages'),
     path('delete_message/<int:message_id>/', views.delete_message, name='delete_message'),
     path('seller_chats/', views.seller_chat_list, name='seller_chat_list'),
     path('seller_home/', views.seller_home, name='seller_home'),
@@ -37,6 +39,9 @@ urlpatterns = [
     path('buyer-request/', views.buyer_request_view, name='buyer_request'),
     path('buyer-request/update/<int:request_id>/<str:status>/', views.update_request_status, name='update_buyer_request_status'),
     path('seller-request/', views.seller_request, name='seller_requests'),
+    path('seller-request/update/<int:request_id>/<str:status>/', views.update_seller_request_status, name='update_seller_request_status'),
+    path('clearance/update/<int:request_id>/<str:status>/', views.update_clearance_status, name='update_clearance_status'),
+    path('requests/<str:queue>/bulk/', views.bulk_update_requests, name='bulk_update_requests'),
     path('seller-request/view/<int:request_id>/', views.view_seller_request, name='view_seller_request'),
     path('request_doctor_clearance/<int:pet_id>/', views.request_doctor_clearance, name='request_doctor_clearance'),
     path('my-requests/', views.my_requests, name='my_requests'),
@@ -49,6 +54,7 @@ urlpatterns = [
     path('deactivate-user/<int:user_id>/', views.deactivate_user, name='deactivate_user'),
     path('update-pet-status/<int:pet_id>/', views.update_pet_status, name='update_pet_status'),
     path('approve-pets/', views.approve_pets, name='approve_pets'),
+    path('approve-pets/bulk/', views.bulk_moderate_pets, name='bulk_moderate_pets'),
     path('approve-pet/<int:pet_id>/', views.approve_pet, name='approve_pet'),
     path('reject-pet/<int:pet_id>/', views.reject_pet, name='reject_pet'),
     path('add-doctor/', views.add_doctor, name='add_doctor'),
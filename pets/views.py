@@ -1,3 +1,6 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, authenticate
 from django.contrib.auth.models import User
@@ -6,12 +9,25 @@ from django.contrib import messages
 from django.contrib.auth.forms import PasswordResetForm
 from django.contrib.auth.views import PasswordResetView
 from django.urls import reverse_lazy
-from django.db.models import Q
-
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, JsonResponse
+
+from . import catalog, chat, duplicates, moderation, queues, scheduling
+from .broker import get_broker
+from .caching import doctor_clearance_counts, invalidate_latest_pets, latest_pets
+from .recommendations import similar_pets
+from .facets import catalog_facets
+from .search import search_pets
 from .forms import CustomLoginForm, CustomUserRegisterForm, DoctorClearanceRequestForm
 from .models import Profile, Pet, Message, Feedback, BuyerRequest, SellerRequest, DoctorClearanceRequest
 
 
+# ROLE CHECKS
+
+def has_role(user, *roles):
+    # One indexed lookup instead of loading the whole profile
+    return Profile.objects.filter(user=user, role__in=roles).exists()
+
 
 # LOGIN VIEW
 def custom_login_view(request):
@@ -96,33 +112,37 @@ def footer(request):
 
 @login_required
 def admin_dashboard(request):
-    return render(request, 'admin_home.html')
+    return render(request, 'admin_home.html', {'queue_counts': queues.status_counts()})
 
 # USER DASHBOARD
 
 @login_required(login_url='login')
 def user_home(request):
-    pets = Pet.objects.filter(is_approved=True).order_by('-id')[:6]
+    pets = latest_pets()
     return render(request, 'user_home.html', {'pets': pets})
 
 # DOCTOR DASHBOARD
 
 @login_required(login_url='login')
 def doctor_dashboard(request):
-    # Check if the user has the 'doctor' role
-    if request.user.profile.role == 'doctor':
-        # You can add any doctor-specific content here
-        doctor = request.user
-        # Example: You can display some doctor-related data (e.g., their patients or clearance requests)
-        context = {
-            'doctor': doctor,
-            # Add any other context here if needed
-        }
-        return render(request, 'doctor_home.html', context)
-    else:
-        # Redirect or show error if user is not a doctor
+    # Only doctors; one indexed lookup instead of loading the whole profile
+    if not Profile.objects.filter(user=request.user, role='doctor').exists():
         return redirect('login')
 
+    status = queues.parse_status(request.GET.get('status'))
+    page = scheduling.assigned_page(
+        request.user, status, after=catalog.parse_timestamp_cursor(request.GET.get('after')),
+    )
+    counts = doctor_clearance_counts(request.user.id)
+    return render(request, 'doctor_home.html', {
+        'doctor': request.user,
+        'clearances': page.items,
+        'page': page,
+        'status': status,
+        'status_counts': {name: counts.get(name, 0) for name in queues.STATUSES},
+        'queue_counts': queues.status_counts(),
+    })
+
 # PASSWORD RESET
 
 class CustomPasswordResetView(PasswordResetView):
@@ -140,7 +160,7 @@ class CustomPasswordResetView(PasswordResetView):
 
 def pet_detail(request, pet_id):
     # Get the pet object
-    pet = get_object_or_404(Pet, id=pet_id)
+    pet = get_object_or_404(Pet.objects.select_related('owner'), id=pet_id)
     
     # Get the first DoctorClearanceRequest related to the logged-in user and the pet
     doctor_request = DoctorClearanceRequest.objects.filter(pet=pet, requested_by=request.user).first()
@@ -148,6 +168,7 @@ def pet_detail(request, pet_id):
     return render(request, 'pet_details.html', {
         'pet': pet,
         'doctor_request': doctor_request,  # Pass the doctor request to the template
+        'similar_pets': similar_pets(pet),
     })
 # Redirect to specific chatroom
 
@@ -180,27 +201,78 @@ def chatroom(request, pet_id, other_user_id):
         messages.error(request, "You cannot chat with yourself.")
         return redirect('pet_detail', pet_id=pet.id)
 
-    messages_qs = Message.objects.filter(
-        pet=pet
-    ).filter(
-        Q(sender=user, receiver=other) | Q(sender=other, receiver=user)
-    ).order_by('timestamp')
-
+    # Without JavaScript/WebSockets the form still posts here
     if request.method == 'POST':
         content = request.POST.get('message')
         if content:
-            Message.objects.create(
-                pet=pet,
-                sender=user,
-                receiver=other,
-                content=content
-            )
+            chat.send_message(pet, user, other, content)
         return redirect('chatroom', pet_id=pet.id, other_user_id=other.id)
 
+    key = (pet.id, *chat.participants(pet, user, other))
+    before = catalog.parse_cursor(request.GET.get('before'))
+    page = chat.history_page(key, before=before)
+    if before is None and page.items:
+        chat.mark_read(key, user, page.items[0].id)
     return render(request, 'chatroom.html', {
         'pet': pet,
         'other_user': other,
-        'messages': messages_qs
+        'messages': page.items,
+        'page': page,
+    })
+
+# CHAT LONG-POLL (for clients without WebSockets)
+
+LONG_POLL_TIMEOUT = 25
+MAX_LONG_POLL_TIMEOUT = 30
+
+
+def _int_param(request, name, default, maximum=None):
+    try:
+        value = max(int(request.GET.get(name, default)), 0)
+    except ValueError:
+        value = default
+    return min(value, maximum) if maximum is not None else value
+
+
+@login_required(login_url='login')
+async def chat_messages(request, pet_id, other_user_id):
+    """Messages newer than ``?since=<id>``, waiting up to ``?timeout=`` seconds for one to arrive."""
+    user = await request.auser()
+    conversation = await sync_to_async(chat.open_conversation)(user, pet_id, other_user_id)
+    if conversation is None:
+        raise Http404("No such conversation.")
+    pet, other, key = conversation
+    since = _int_param(request, 'since', 0)
+    timeout = _int_param(request, 'timeout', LONG_POLL_TIMEOUT, MAX_LONG_POLL_TIMEOUT)
+    fetch = sync_to_async(chat.messages_since)
+
+    # Subscribe before reading so a message sent in between is not missed
+    async with get_broker().subscribe(chat.channel_name(key)) as subscription:
+        new_messages = await fetch(key, since)
+        if not new_messages and timeout:
+            try:
+                await asyncio.wait_for(subscription.get(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            else:
+                new_messages = await fetch(key, since)
+
+    if new_messages:
+        await sync_to_async(chat.mark_read)(key, user, new_messages[-1].id)
+    return JsonResponse({
+        'messages': [chat.serialize_message(message) for message in new_messages],
+        'last_id': new_messages[-1].id if new_messages else since,
+    })
+
+# UNREAD CHAT MESSAGES
+
+@login_required(login_url='login')
+def unread_messages(request):
+    """Unread message counts for every conversation of the user, keyed by conversation id."""
+    counts = chat.unread_counts(request.user)
+    return JsonResponse({
+        'total': sum(counts.values()),
+        'conversations': {str(conversation_id): unread for conversation_id, unread in counts.items()},
     })
 
 # DELETE A CHAT MESSAGE
@@ -208,31 +280,22 @@ def chatroom(request, pet_id, other_user_id):
 @login_required(login_url='login')
 def delete_message(request, message_id):
     msg = get_object_or_404(Message, id=message_id)
-    if msg.sender == request.user:
-        msg.delete()
-    return redirect('chatroom', pet_id=msg.pet.id, other_user_id=msg.receiver.id)
+    if msg.sender_id == request.user.id:
+        chat.delete_message(msg)
+    return redirect('chatroom', pet_id=msg.pet_id, other_user_id=msg.receiver_id)
 
 # SELLER CHAT LIST
 
 @login_required(login_url='login')
 def seller_chat_list(request):
-    seller = request.user
-    pets = Pet.objects.filter(seller=seller)
-    messages = Message.objects.filter(pet__in=pets)
-
-    chatrooms = {}
-    for msg in messages:
-        pet = msg.pet
-        buyer = msg.receiver if msg.sender == seller else msg.sender
-        key = (pet.id, buyer.id)
-        if key not in chatrooms:
-            chatrooms[key] = {
-                'pet': pet,
-                'buyer': buyer
-            }
-
+    page = chat.inbox_page(request.user, 'seller', after=catalog.parse_timestamp_cursor(request.GET.get('after')))
+    unread = chat.unread_counts(request.user, 'seller')
+    for room in page.items:
+        room.unread = unread.get(room.id, 0)
     return render(request, 'seller_chat_list.html', {
-        'chatrooms': chatrooms.values()
+        'chatrooms': page.items,
+        'page': page,
+        'unread_chat_count': sum(unread.values()),
     })
 
 @login_required(login_url='login')
@@ -264,6 +327,7 @@ def add_pets(request):
             image=image,
             is_approved=False
         )
+        invalidate_latest_pets()
         return redirect('view_my_pets')
     return render(request, 'add_pets.html')
 
@@ -271,7 +335,7 @@ def add_pets(request):
 
 @login_required(login_url='login')
 def view_my_pets(request):
-    pets = Pet.objects.filter(owner=request.user)
+    pets = Pet.objects.filter(owner=request.user).for_list()
     return render(request, 'view_my_pets.html', {'pets': pets})
 
 # FEEDBACK FORM DISPLAY
@@ -299,32 +363,93 @@ def thank_you(request):
 # SELLER REQUESTS
 @login_required(login_url='login')
 def seller_request(request):
-    seller_requests = SellerRequest.objects.all()
+    status = queues.parse_status(request.GET.get('status'))
+    page = queues.queue_page(SellerRequest, status, after=catalog.parse_timestamp_cursor(request.GET.get('after')))
     return render(request, 'seller_requests.html', {
-        'seller_requests': seller_requests,
+        'seller_requests': page.items,
+        'page': page,
+        'status': status,
+        'status_counts': queues.status_counts()['seller'],
     })
 @login_required(login_url='login')
 def view_seller_request(request, request_id):
-    seller_request = get_object_or_404(SellerRequest, id=request_id)
-    return render(request, 'view_seller_request.html', {
-        'seller_requests': seller_request,
+    seller_request = get_object_or_404(SellerRequest.objects.for_list(), id=request_id)
+    return render(request, 'seller_requests.html', {
+        'seller_requests': [seller_request],
     })
 
 # BUYER REQUEST VIEW
 @login_required
 def buyer_request_view(request):
-    requests = DoctorClearanceRequest.objects.all().order_by('-created_at')
-    return render(request, 'buyer_request.html', {'requests': requests})
+    status = queues.parse_status(request.GET.get('status'))
+    page = queues.queue_page(BuyerRequest, status, after=catalog.parse_timestamp_cursor(request.GET.get('after')))
+    return render(request, 'buyer_request.html', {
+        'buyer_requests': page.items,
+        'page': page,
+        'status': status,
+        'status_counts': queues.status_counts()['buyer'],
+    })
     
 
 @login_required(login_url='login')
 def update_request_status(request, request_id, status):
-    buyer_request = BuyerRequest.objects.get(id=request_id, pet__seller=request.user)
-    if status in ['Approved', 'Rejected']:
-        buyer_request.status = status
-        buyer_request.save()
+    if request.method == 'POST' and status in queues.DECISIONS:
+        # Only the pet's seller decides, and only while the request is pending
+        if not queues.transition(BuyerRequest, [request_id], status, pet__seller=request.user):
+            messages.error(request, "That request was not pending or is not yours to decide.")
     return redirect('buyer_request')
 
+# SELLER AND CLEARANCE REQUEST DECISIONS
+
+# Roles that review sellers' requests to list a pet
+SELLER_REQUEST_REVIEWERS = ('admin', 'doctor')
+
+def can_review_seller_requests(user):
+    return has_role(user, *SELLER_REQUEST_REVIEWERS)
+
+@login_required(login_url='login')
+def update_seller_request_status(request, request_id, status):
+    if not can_review_seller_requests(request.user):
+        raise PermissionDenied("Only admins and doctors can decide seller requests.")
+    if request.method == 'POST' and status in queues.DECISIONS:
+        if not queues.transition(SellerRequest, [request_id], status):
+            messages.error(request, "That request has already been decided.")
+    return redirect('seller_requests')
+
+@login_required(login_url='login')
+def update_clearance_status(request, request_id, status):
+    if request.method == 'POST' and status in queues.DECISIONS:
+        if not queues.transition(DoctorClearanceRequest, [request_id], status, doctor=request.user):
+            messages.error(request, "That request was not pending or is not assigned to you.")
+    return redirect('doctor_home')
+
+# Which of a queue's requests a user may decide (None: none of them), and where its page lives
+BULK_QUEUES = {
+    'buyer': (lambda user: {'pet__seller': user}, 'buyer_request'),
+    'seller': (lambda user: {} if can_review_seller_requests(user) else None, 'seller_requests'),
+    'clearance': (lambda user: {'doctor': user}, 'doctor_home'),
+}
+
+@login_required(login_url='login')
+def bulk_update_requests(request, queue):
+    if queue not in BULK_QUEUES:
+        raise Http404("No such request queue.")
+    allowed, page = BULK_QUEUES[queue]
+    if request.method == 'POST':
+        status = request.POST.get('status')
+        request_ids = [int(request_id) for request_id in request.POST.getlist('request_ids') if request_id.isdigit()]
+        filters = allowed(request.user)
+        if filters is None:
+            raise PermissionDenied("You are not allowed to decide these requests.")
+        if not request_ids:
+            messages.warning(request, "Select at least one request.")
+        elif status in queues.DECISIONS:
+            changed = queues.transition(queues.QUEUES[queue], request_ids, status, **filters)
+            messages.success(request, f"{changed} request(s) marked {status.lower()}.")
+            if changed < len(request_ids):
+                messages.warning(request, f"{len(request_ids) - changed} request(s) were already decided and left unchanged.")
+    return redirect(page)
+
 # MY REQUEST VIEW
 from .models import AdoptionRequest  # Assuming your model is named AdoptionRequest
 
@@ -336,19 +461,21 @@ def request_doctor_clearance(request, pet_id):
     existing_request = DoctorClearanceRequest.objects.filter(pet=pet, requested_by=request.user).first()
 
     if not existing_request:
-        DoctorClearanceRequest.objects.create(pet=pet, requested_by=request.user)
-    
+        clearance = DoctorClearanceRequest.objects.create(pet=pet, requested_by=request.user)
+        # Requests that find no free doctor wait for manage.py assign_clearances
+        scheduling.assign(clearance)
+
     return redirect('pet_detail', pet_id=pet.id)
 
 @login_required
 def my_requests(request):
-    requests = DoctorClearanceRequest.objects.filter(requested_by=request.user).order_by('-created_at')
+    requests = DoctorClearanceRequest.objects.filter(requested_by=request.user).for_list().order_by('-created_at')
     return render(request, 'my_requests.html', {'requests': requests})
 
 
 @login_required(login_url='login')# View to manage all user profiles
 def manage_users(request):
-    profiles = Profile.objects.select_related('user').all()
+    profiles = Profile.objects.for_list()
     return render(request, 'manage_users.html', {'profiles': profiles})
 
 @login_required(login_url='login')
@@ -381,8 +508,27 @@ def deactivate_user(request, user_id):
 
 @login_required(login_url='login')
 def view_pets(request):
-    pets = Pet.objects.filter(is_approved=True)
-    return render(request, 'viewpets.html', {'pets': pets})
+    filters = catalog.parse_filters(request.GET)
+    query = request.GET.get('q', '').strip()
+    pets = catalog.apply_filters(Pet.objects.filter(is_approved=True).for_list(), filters)
+    if query:
+        # Ranked search results are capped instead of cursor-paginated
+        page = catalog.Page(items=search_pets(query, pets, limit=catalog.PAGE_SIZE))
+    else:
+        page = catalog.keyset_page(
+            pets,
+            after=catalog.parse_cursor(request.GET.get('after')),
+            before=catalog.parse_cursor(request.GET.get('before')),
+        )
+    return render(request, 'viewpets.html', {
+        'pets': page.items,
+        'page': page,
+        'query': query,
+        'filters': filters,
+        'facets': catalog_facets(filters, query),
+        'next_query': catalog.filters_querystring(filters, after=page.next_cursor),
+        'prev_query': catalog.filters_querystring(filters, before=page.prev_cursor),
+    })
 
 
 @login_required(login_url='login')
@@ -397,6 +543,7 @@ def update_pet_status(request, pet_id):
             pet.is_approved = False
             messages.warning(request, f"Pet '{pet.name}' has been rejected.")
         pet.save()
+        invalidate_latest_pets()
     return redirect('viewpets')  # Replace with your view name for showing the pet list
 
 
@@ -404,8 +551,37 @@ def update_pet_status(request, pet_id):
 
 @login_required(login_url='login')
 def approve_pets(request):
-    pets = Pet.objects.filter(is_approved=False)
-    return render(request, 'approvepets.html', {'pets': pets})
+    # Oldest submissions first
+    page = catalog.keyset_page(
+        Pet.objects.filter(is_approved=False).for_list(),
+        after=catalog.parse_cursor(request.GET.get('after')),
+        before=catalog.parse_cursor(request.GET.get('before')),
+        descending=False,
+    )
+    near_duplicates = duplicates.find_near_duplicates(page.items)
+    for pet in page.items:
+        pet.near_duplicates = near_duplicates.get(pet.id, [])
+    return render(request, 'approvepets.html', {'pets': page.items, 'page': page})
+
+# Roles that approve and reject pet listings
+PET_MODERATORS = ('admin',)
+
+@login_required(login_url='login')
+def bulk_moderate_pets(request):
+    if not has_role(request.user, *PET_MODERATORS):
+        raise PermissionDenied("Only admins can moderate pets.")
+    if request.method == 'POST':
+        action = request.POST.get('action')
+        pet_ids = [int(pet_id) for pet_id in request.POST.getlist('pet_ids') if pet_id.isdigit()]
+        if not pet_ids:
+            messages.warning(request, "Select at least one pet.")
+        elif action == 'approve':
+            count = moderation.approve_pets(pet_ids)
+            messages.success(request, f"{count} pet(s) have been approved.")
+        elif action == 'reject':
+            count = moderation.reject_pets(pet_ids)
+            messages.warning(request, f"{count} pet(s) have been rejected and removed.")
+    return redirect('approve_pets')
 
 @login_required(login_url='login')
 def approve_pet(request, pet_id):
@@ -413,6 +589,7 @@ def approve_pet(request, pet_id):
         pet = get_object_or_404(Pet, id=pet_id)
         pet.is_approved = True
         pet.save()
+        invalidate_latest_pets()
         messages.success(request, f"{pet.name} has been approved.")
     return redirect('approve_pets')
 
@@ -421,7 +598,9 @@ def reject_pet(request, pet_id):
     if request.method == 'POST':
         pet = get_object_or_404(Pet, id=pet_id)
         pet_name = pet.name
-        pet.delete()
+        with queues.deleting_pets(Pet.objects.filter(pk=pet.pk)):
+            pet.delete()
+        invalidate_latest_pets()
         messages.warning(request, f"{pet_name} has been rejected and removed.")
     return redirect('approve_pets')
 
@@ -466,7 +645,7 @@ def add_doctor(request):
 @login_required(login_url='login')
 def view_doctors(request):
     # If using Profile model to get doctors
-    doctors = Profile.objects.filter(role='doctor')
+    doctors = Profile.objects.filter(role='doctor').for_list()
 
     # If using Doctor model for detailed doctor info
     # doctors = Doctor.objects.all()
@@ -597,6 +776,7 @@ def mark_as_adopted(request, pet_id):
     if request.method == 'POST':
         pet.is_adopted = True  # Mark the pet as adopted
         pet.save()  # Save the changes to the database
+        invalidate_latest_pets()
     return redirect('view_my_pets')  # Redirect back to the 'View My Pets' page
 
 from .models import Product